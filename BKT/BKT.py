@@ -1,13 +1,24 @@
-# Data loading
-import csv
 # CLI argument handling
 import sys
 # Output final results as table
 import pandas as pd
+# Vectorized engine processing all students at once
+import numpy as np
+from batch import encode_kcs, kc_params, process_batch
+# Chunked processing of files larger than memory
+from streaming import StreamingBKT
+# Fitting the parameters from the data
+from fitting import fit_kcs
+# Binary cache of loaded data files
+from cache import load_cache, save_cache
+# Recording the P(L) after each step
+from trajectory import allocate_trajectory, save_trajectory, trajectory_table
+# Scoring the predictions of the model
+from evaluation import evaluate, predict
 
 
 class BKTModel:
-    def __init__(self, data, **params):
+    def __init__(self, data, n_kcs=5, **params):
         '''
         Constructor
 
@@ -21,45 +32,50 @@ class BKTModel:
         P(S) is probability of making a slip, if student does know the skill.
         P(T) is probability of learning the skill if the student does not know the skill.
 
+        Each parameter may be a single value, or a sequence with a value for each KC.
+
+        The data are the StepID, Correct and KC index columns for the student's rows.
+
         Results vector is an array of values, each the current P(Li) for each step and
         corresponding KC_n. They are initialized all with the value of P(L_0).
         '''
+        params = kc_params(params, n_kcs)
         self.initial_prob_l = params['initial_prob_l']
         self.prob_g = params['prob_g']
         self.prob_s = params['prob_s']
         self.prob_t = params['prob_t']
         self.data = data
-        self.result_vector = [self.initial_prob_l] * 5
+        self.n_kcs = n_kcs
+        self.result_vector = self.initial_prob_l.copy()
 
     def process_student(self, verbose=False):
         '''
         Process the rows for the student.
 
-        For each row we determins which KC column is associated with the step. We then
+        For each row we have the index of the KC associated with the step. We then
         update the value stored in that element of the result_vector, based on the previous
         P(L_i-1). 
         '''
-        for row in self.data:
-            # Get index of associated KCn. If row all zeros, skip that row.
-            kc_index = [i for i in range(2, len(row)) if row[i] == 1]
-            if len(kc_index) == 0:
+        steps, correct, kcs = self.data
+        for step, question, kc_index in zip(steps, correct, kcs):
+            # If row has no associated KCn, skip that row.
+            if kc_index < 0:
                 continue
-            kc_index = kc_index[0]
 
             # get previous P(Li-1)
-            previous_p_l = self.result_vector[kc_index - 2]
+            previous_p_l = self.result_vector[kc_index]
 
             # Calculate P(Li) for current step
-            self.result_vector[kc_index - 2] = self.__calc_update(row, previous_p_l)
+            self.result_vector[kc_index] = self.__calc_update(question, kc_index, previous_p_l)
 
             if verbose:
-                print(f'Step {row[0]}: ', end='')
-                for i in range(5):
+                print(f'Step {step}: ', end='')
+                for i in range(self.n_kcs):
                     print(f'KC{i+1}={self.result_vector[i]}', end= ' ')
                 print('')
         return self.result_vector
 
-    def __calc_update(self, row, previous_p_l):
+    def __calc_update(self, question, kc_index, previous_p_l):
         '''
         Perform the actual calculations, following the equations found in 
         van de Sande, B. (2013). "Properties of the Bayesian Knowledge Tracing Model." 
@@ -67,24 +83,25 @@ class BKTModel:
 
         https://doi.org/10.5281/zenodo.3554629
 
-        The input is the individual row of data, and the previous P(Li-1) fpr the spcific
-        KCn.
+        The input is the Correct flag and KC index of the row of data, and the previous
+        P(Li-1) fpr the spcific KCn.
         '''
-        question = row[1]
+        prob_g = self.prob_g[kc_index]
+        prob_s = self.prob_s[kc_index]
 
         # The differences in the equation depending on if answer is correct or not
         if question:
-            s = 1 - self.prob_s
-            g = self.prob_g
+            s = 1 - prob_s
+            g = prob_g
         else:
-            s = self.prob_s
-            g = 1 - self.prob_g
+            s = prob_s
+            g = 1 - prob_g
 
         enumerator = previous_p_l * s
         denominator = previous_p_l * s + (1 - previous_p_l) * g
         assert denominator != 0, 'needs smoothing!'
         prob_l_1 = enumerator / denominator
-        prob_l = prob_l_1 + (1 - prob_l_1) * self.prob_t
+        prob_l = prob_l_1 + (1 - prob_l_1) * self.prob_t[kc_index]
         return prob_l
     
 
@@ -95,46 +112,110 @@ class BKT:
         '''
         self.verbose=verbose
         self.initial_params = params
-        self.data = []
         self.students = []
+        self.kcs = []
         self.results_matrix = []
         pass
 
-    def load_csv(self, file_path):
+    def load_csv(self, file_path, cache=True):
         '''
         Load the data file as CSV
 
+        The file is read once into a columnar layout: an array each for StepID,
+        Correct and the KC of each row. The KC is stored as a small integer index
+        into self.kcs, whether the file has one-hot KCn columns or a single KC
+        column naming the KC. The rows are grouped by student (keeping their order
+        within each student), and the range of rows for each student is indexed,
+        so fetching the data for a student is a simple slice.
+
+        Unless cache is False, the columns are also saved in a binary cache next
+        to the file. Later loads memory-map the cache rather than parsing the
+        file again, for as long as the file is unchanged.
+
         input: file_path, the file path for the data
+               cache, bool, whether to use the binary cache (default is True)
         '''
-        with open(file_path, 'r') as FP:
-            # read first line to skip headers
-            FP.readline()
-
-            # read rest of file and store in 2-d array
-            reader = csv.reader(FP, delimiter=',')
-            for row in reader:
-                # convert all but student id column to integers
-                row = [row[0]] + [int(row[i]) for i in range(1, len(row))]
-                self.data.append(row)
-        
+        columns = load_cache(file_path) if cache else None
+        if columns is None:
+            columns = self.__parse_csv(file_path)
+            if cache:
+                try:
+                    save_cache(file_path, columns)
+                except OSError:
+                    # the cache is only an optimization, e.g. the directory
+                    # may be read-only
+                    pass
+
+        self.students = columns['students'].tolist()
+        self.kcs = columns['kcs'].tolist()
+        self.student_codes = columns['student_codes']
+        self.steps = columns['steps']
+        self.correct = columns['correct']
+        self.kc_idx = columns['kc_idx']
+
         # Get number of rows
-        self.n_data = len(self.data)
+        self.n_data = len(self.steps)
+
+        # index of the row range for each student
+        bounds = columns['bounds'].tolist()
+        self.student_rows = {student: (bounds[i], bounds[i + 1]) 
+                             for i, student in enumerate(self.students)}
 
-        # list of unique students
-        for row in self.data:
-            if row[0] not in self.students:
-                self.students.append(row[0])
+    def __parse_csv(self, file_path):
+        '''
+        Parse the data file into its columns
+
+        input: file_path, the file path for the data
+        returns: dictionary of the column arrays by name
+        '''
+        frame = pd.read_csv(file_path, dtype={0: str})
+
+        # code each row by its student, in order of first appearance
+        student_codes, students = pd.factorize(frame.iloc[:, 0])
+
+        # code each row by its KC
+        kc_idx, kcs = encode_kcs(frame)
+        kc_dtype = np.int16 if len(kcs) < np.iinfo(np.int16).max else np.int32
+        steps = frame.iloc[:, 1].to_numpy(dtype=np.int64)
+        correct = frame.iloc[:, 2].to_numpy(dtype=np.int8)
+        kc_idx = kc_idx.astype(kc_dtype)
+
+        # make sure the rows of each student are contiguous
+        if np.any(np.diff(student_codes) < 0):
+            order = np.argsort(student_codes, kind='stable')
+            student_codes = student_codes[order]
+            steps, correct, kc_idx = steps[order], correct[order], kc_idx[order]
+
+        return {'students': np.array(students, dtype=str),
+                'kcs': np.array(kcs, dtype=str),
+                'student_codes': student_codes,
+                'bounds': np.searchsorted(student_codes, np.arange(len(students) + 1)),
+                'steps': steps,
+                'correct': correct,
+                'kc_idx': kc_idx}
 
     def get_student_data(self, student_ID):
         '''
-        Filter the data for rows for a given student by their ID
+        Fetch the rows for a given student by their ID
+
+        Input: the student_ID
+        returns: the StepID, Correct and KC index columns for that student
+        '''
+        start, stop = self.student_rows[student_ID]
+        return self.steps[start:stop], self.correct[start:stop], self.kc_idx[start:stop]
+
+    def __student_index(self, students):
+        '''
+        Map each row to the index of its student within the students selected.
 
-        Input: the student_ID, an int
-        returns: the data for that student
+        Input: students, list of student IDs
+        returns: array of student indexes, one per row (-1 if not selected)
         '''
-        data = [self.data[i][1:] for i in range(self.n_data) if 
-                         self.data[i][0] == student_ID]
-        return data
+        lookup = np.full(len(self.students), -1, dtype=np.int64)
+        for i, student in enumerate(students):
+            start, stop = self.student_rows[student]
+            lookup[self.student_codes[start]] = i
+        return lookup[self.student_codes]
 
     def process_students(self, students=None):
         '''
@@ -154,7 +235,7 @@ class BKT:
             data = self.get_student_data(student)
 
             # instantiate the BKTModel class for that student
-            bkt = BKTModel(data, **self.initial_params)
+            bkt = BKTModel(data, len(self.kcs), **self.initial_params)
 
             # Obtain results and add to final result matrix
             result = bkt.process_student(self.verbose)
@@ -163,13 +244,177 @@ class BKT:
         # compile results into a pandas dataframe for formatted table
         results = pd.DataFrame(self.results_matrix, 
                                index=students,
-                               columns=['KC_1', 'KC_2', 'KC_3', 'KC_4', 'KC_5'])
+                               columns=self.kcs)
+        results['Mean'] = results.mean(axis=1)
+        return results
+
+    def process_students_batch(self, students=None, sparse=False):
+        '''
+        Drop-in alternative to process_students, using the vectorized batch
+        engine. All the students are processed in one pass over the data as
+        NumPy arrays, rather than a BKTModel per student. Verbose mode is
+        ignored here.
+
+        With thousands of KCs the students x KCs table is mostly P(L0). In sparse
+        mode the results are instead a long table with the final P(L) only for
+        the (student, KC) pairs that have steps.
+        '''
+        if students is None:
+            students = self.students
+
+        # index the selected students, and keep only their rows
+        student_idx = self.__student_index(students)
+        rows = student_idx >= 0
+        result = process_batch(student_idx[rows], self.correct[rows], self.kc_idx[rows],
+                               len(students), len(self.kcs), sparse=sparse,
+                               **self.initial_params)
+
+        if sparse:
+            student_idx, kc_idx, result = result
+            index = pd.MultiIndex.from_arrays([np.asarray(students, dtype=object)[student_idx],
+                                               np.asarray(self.kcs, dtype=object)[kc_idx]],
+                                              names=['Student', 'KC'])
+            return pd.DataFrame({'P(L)': result}, index=index)
+
+        # compile results into a pandas dataframe for formatted table
+        results = pd.DataFrame(result,
+                               index=students,
+                               columns=self.kcs)
+        results['Mean'] = results.mean(axis=1)
+        return results
+
+    def record_trajectories(self, students=None, every=1, file_path=None):
+        '''
+        Record the P(Li) after each step, the learning curve of each student for
+        each KC, rather than printing them as in verbose mode. The values are
+        written into a preallocated array, or with file_path into a trajectory
+        file on disk (see trajectory.py), as the batch engine processes the data.
+
+        input: students, list of student IDs to record (default is all students)
+               every, int, record only every n-th step of each student (default 1)
+               file_path, path of a trajectory directory to write (optional)
+        returns: pandas dataframe of the Student, StepID, KC and P(L) of each
+                 recorded step
+        '''
+        if students is None:
+            students = self.students
+
+        # index the selected students, and keep only their rows
+        student_idx = self.__student_index(students)
+        rows = student_idx >= 0
+        student_idx = student_idx[rows]
+        kc_idx = self.kc_idx[rows]
+
+        # the position of each step within the rows of its student
+        index = np.arange(len(student_idx))
+        starts = np.ones(len(student_idx), dtype=bool)
+        starts[1:] = student_idx[1:] != student_idx[:-1]
+        position = index - np.maximum.accumulate(np.where(starts, index, 0))
+
+        # slot in the trajectory of each recorded row, or -1
+        recorded = (kc_idx >= 0) & (position % every == 0)
+        record = np.full(len(student_idx), -1, dtype=np.int64)
+        record[recorded] = np.arange(recorded.sum())
+
+        trajectory = allocate_trajectory(recorded.sum(), file_path)
+        process_batch(student_idx, self.correct[rows], kc_idx,
+                      len(students), len(self.kcs),
+                      trajectory=trajectory, record=record,
+                      **self.initial_params)
+
+        columns = {'students': np.array(students, dtype=str),
+                   'kcs': np.array(self.kcs, dtype=str),
+                   'student_codes': student_idx[recorded],
+                   'steps': self.steps[rows][recorded],
+                   'kc_idx': kc_idx[recorded],
+                   'p_l': trajectory}
+        if file_path is not None:
+            save_trajectory(file_path, columns)
+        return trajectory_table(columns)
+
+    def predict(self, students=None):
+        '''
+        Predict the probability of a correct answer before each step, from the
+        P(Li-1) at that point.
+
+        input: students, list of student IDs (default is all students)
+        returns: pandas dataframe of the Student, StepID, KC, Correct and
+                 predicted P(correct) of each step with a KC
+        '''
+        if students is None:
+            students = self.students
+
+        # index the selected students, and keep only their rows
+        student_idx = self.__student_index(students)
+        rows = (student_idx >= 0) & (self.kc_idx >= 0)
+        student_idx = student_idx[rows]
+        predictions = predict(student_idx, self.correct[rows], self.kc_idx[rows],
+                              len(students), len(self.kcs), **self.initial_params)
+        return pd.DataFrame({'Student': np.asarray(students, dtype=object)[student_idx],
+                             'StepID': self.steps[rows],
+                             'KC': np.asarray(self.kcs, dtype=object)[self.kc_idx[rows]],
+                             'Correct': self.correct[rows],
+                             'P(correct)': predictions})
+
+    def evaluate(self, n_folds=None, fit_method=None, n_jobs=None, seed=0):
+        '''
+        Score the predicted P(correct) before each step against the Correct
+        column, with AUC, RMSE and log loss. Optionally split the students into
+        n_folds folds, and with fit_method fit the parameters on the other
+        folds to score each fold.
+
+        input: n_folds, int, number of folds (optional)
+               fit_method, string {'grid', 'em'} (optional, default is to use
+                           the initial parameters)
+               n_jobs, int, number of worker processes for fitting
+               seed, int, seed for assigning students to folds
+        returns: pandas dataframe of the scores for each fold and overall
+        '''
+        return evaluate(self.student_codes, self.correct, self.kc_idx,
+                        len(self.students), self.kcs,
+                        n_folds=n_folds, fit_method=fit_method,
+                        n_jobs=n_jobs, seed=seed, **self.initial_params)
+
+    def fit(self, method='grid', n_jobs=None, **options):
+        '''
+        Fit the initial parameters for each KCn from the loaded data, instead
+        of using fixed values. The KCs are fitted in parallel over a process pool.
+
+        input: method, string {'grid', 'em'}, brute force grid search or
+                       Expectation-Maximization
+               n_jobs, int, number of worker processes (default is all the cores)
+               options, passed on to fitting.grid_search or fitting.em_fit
+        returns: pandas dataframe of the fitted parameters for each KCn
+        '''
+        return fit_kcs(self.student_codes, self.correct, self.kc_idx, self.kcs,
+                       method=method, n_jobs=n_jobs, **options)
+
+    def process_stream(self, file_path, chunk_size=100000):
+        '''
+        Process a data file in chunks of chunk_size rows, without loading
+        it with load_csv first. Only the current P(L) values of each student
+        are held between chunks, so files larger than memory can be
+        processed. Gives the same results as process_students.
+
+        input: file_path, the file path for the data
+               chunk_size, int, maximum number of rows read at a time
+        '''
+        stream = StreamingBKT(**self.initial_params)
+        result = stream.process_file(file_path, chunk_size=chunk_size)
+        self.students = stream.students
+        self.kcs = stream.kcs
+
+        # compile results into a pandas dataframe for formatted table
+        results = pd.DataFrame(result,
+                               index=stream.students,
+                               columns=stream.kcs)
         results['Mean'] = results.mean(axis=1)
         return results
 
 
 def main():
     verbose = len(sys.argv) > 1 and sys.argv[1] == 'verbose'
+    batch = len(sys.argv) > 1 and sys.argv[1] == 'batch'
 
     initial_params = {'initial_prob_l': 0.2,
                     'prob_g': 0.25,
@@ -178,7 +423,10 @@ def main():
 
     bkt = BKT(verbose, **initial_params)
     bkt.load_csv('BKTData.csv')
-    results = bkt.process_students()
+    if batch:
+        results = bkt.process_students_batch()
+    else:
+        results = bkt.process_students()
     print(f'\n{results}')
 
 if __name__ == '__main__':
@@ -0,0 +1,254 @@
+# Vectorized calculations
+import numpy as np
+# Encoding the KCs of data frames
+import pandas as pd
+
+'''
+Batch BKT engine
+
+Rather than walking the rows of each student one at a time, the whole data
+set is processed at once as NumPy arrays. Each (student, KC) pair forms an
+independent sequence of steps, so the n-th step of every sequence can be
+updated together in one vectorized operation. The number of Python level
+iterations is thus the length of the longest sequence, rather than the
+number of rows.
+
+The arithmetic is performed in the same order as BKTModel.__calc_update,
+so the results match BKTModel.process_student exactly.
+'''
+
+# names of the model parameters
+PARAMS = ['initial_prob_l', 'prob_g', 'prob_s', 'prob_t']
+
+
+def calc_update(previous_p_l, correct, prob_g, prob_s, prob_t):
+    '''
+    Vectorized version of BKTModel.__calc_update
+
+    Input: previous_p_l, array of P(Li-1) values
+           correct, array of the Correct flags for the same steps
+           prob_g, prob_s, prob_t, the model parameters (scalars or arrays
+           broadcastable against previous_p_l)
+    returns: array of updated P(Li) values
+    '''
+    correct = np.asarray(correct, dtype=bool)
+
+    # The differences in the equation depending on if answer is correct or not
+    s = np.where(correct, 1 - prob_s, prob_s)
+    g = np.where(correct, prob_g, 1 - prob_g)
+
+    enumerator = previous_p_l * s
+    denominator = previous_p_l * s + (1 - previous_p_l) * g
+    assert not np.any(denominator == 0), 'needs smoothing!'
+    prob_l_1 = enumerator / denominator
+    prob_l = prob_l_1 + (1 - prob_l_1) * prob_t
+    return prob_l
+
+
+def prob_correct(previous_p_l, prob_g, prob_s):
+    '''
+    Predicted probability of a correct answer at a step, given the P(Li-1)
+    before it.
+
+    Input: previous_p_l, array of P(Li-1) values
+           prob_g, prob_s, the model parameters (scalars or arrays)
+    returns: array of P(correct) values
+    '''
+    return previous_p_l * (1 - prob_s) + (1 - previous_p_l) * prob_g
+
+
+def order_by_step(student_idx, kc_idx, n_kcs):
+    '''
+    Arrange the rows so the n-th step of every (student, KC) sequence is
+    contiguous. Rows with a negative KC index have no KC association and
+    are dropped.
+
+    Input: student_idx, array of student indexes, one per row
+           kc_idx, array of KC indexes, one per row (-1 if none)
+           n_kcs, int, number of KCs
+    returns: rows, the original row numbers in processing order
+             keys, the flat student * n_kcs + kc index for each of those rows
+             bounds, array so rows[bounds[k]:bounds[k + 1]] are the k-th steps
+    '''
+    student_idx = np.asarray(student_idx, dtype=np.int64)
+    kc_idx = np.asarray(kc_idx, dtype=np.int64)
+    rows = np.flatnonzero(kc_idx >= 0)
+    keys = student_idx[rows] * n_kcs + kc_idx[rows]
+
+    # group rows by sequence, keeping the original order of the steps
+    order = np.argsort(keys, kind='stable')
+    rows = rows[order]
+    keys = keys[order]
+
+    # position of each row within its own sequence
+    index = np.arange(len(keys))
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    position = index - np.maximum.accumulate(np.where(starts, index, 0))
+
+    # now group by position, so each step of the sequences is one slice
+    order = np.argsort(position, kind='stable')
+    rows = rows[order]
+    keys = keys[order]
+    position = position[order]
+    n_steps = position[-1] + 1 if len(position) > 0 else 0
+    bounds = np.searchsorted(position, np.arange(n_steps + 1))
+    return rows, keys, bounds
+
+
+def first_kc(kcs):
+    '''
+    Find the KC associated with each row of one-hot KCn columns. As in
+    BKTModel, if a row has more than one KC the first is used.
+
+    Input: kcs, 2-d array of the KCn columns
+    returns: array of KC indexes, one per row (-1 if the row is all zeros)
+    '''
+    kcs = np.asarray(kcs)
+    return np.where(kcs.any(axis=1), (kcs == 1).argmax(axis=1), -1)
+
+
+def encode_kcs(frame):
+    '''
+    Encode the KC of each row of a data frame as an index. The data can have
+    either one-hot KCn columns, or a single KC column holding the name of the
+    KC for each row.
+
+    Input: frame, pandas DataFrame with the Student, StepID and Correct columns
+           followed by the KC column(s)
+    returns: codes, array of KC indexes into kcs, one per row (-1 if none)
+             kcs, list of the KC names
+    '''
+    kc_columns = list(frame.columns[3:])
+    if len(kc_columns) == 1 and kc_columns[0].upper() == 'KC':
+        codes, kcs = pd.factorize(frame.iloc[:, 3])
+        return codes, [str(kc) for kc in kcs]
+    return first_kc(frame.iloc[:, 3:].to_numpy()), kc_columns
+
+
+def kc_params(params, n_kcs):
+    '''
+    Expand the parameters to one value per KC. Each parameter can be given
+    either as a single value shared by all the KCs, or as a sequence with
+    a value for each KC.
+
+    Input: params, dictionary of the parameters as given to BKTModel
+           n_kcs, int, number of KCs
+    returns: dictionary of arrays of n_kcs values
+    '''
+    return {name: np.broadcast_to(np.asarray(value, dtype=np.float64), (n_kcs,))
+            for name, value in params.items()}
+
+
+def apply_steps(flat_state, slots, rows, bounds, correct, kc_idx,
+                trajectory=None, record=None, predictions=None, **params):
+    '''
+    Apply the steps ordered by order_by_step to a flat array of P(L) values,
+    in place.
+
+    Optionally the P(Li) after each step is recorded in a trajectory array,
+    and the predicted P(correct) before each step in a predictions array.
+
+    Input: flat_state, array of P(Li-1) values, one per sequence
+           slots, index into flat_state of the sequence of each ordered row
+           rows, bounds, the ordered rows and step boundaries from order_by_step
+           correct, array of Correct flags, one per original row
+           kc_idx, array of KC indexes, one per original row
+           trajectory, preallocated array for the P(Li) of the recorded rows (optional)
+           record, index into trajectory for each original row, -1 if the row
+                   is not recorded (default is every row, in order)
+           predictions, array for the P(correct) of each original row (optional)
+           params, the parameters with a value per KC, as from kc_params
+    '''
+    correct = np.asarray(correct, dtype=bool)
+    if trajectory is not None and record is None:
+        record = np.arange(len(kc_idx))
+
+    # each step updates one element of many sequences at once
+    for k in range(len(bounds) - 1):
+        step_rows = rows[bounds[k]:bounds[k + 1]]
+        step_slots = slots[bounds[k]:bounds[k + 1]]
+        step_kcs = kc_idx[step_rows]
+        if predictions is not None:
+            predictions[step_rows] = prob_correct(flat_state[step_slots],
+                                                  params['prob_g'][step_kcs],
+                                                  params['prob_s'][step_kcs])
+        flat_state[step_slots] = calc_update(flat_state[step_slots],
+                                             correct[step_rows],
+                                             params['prob_g'][step_kcs],
+                                             params['prob_s'][step_kcs],
+                                             params['prob_t'][step_kcs])
+
+        if trajectory is not None:
+            step_record = record[step_rows]
+            keep = step_record >= 0
+            trajectory[step_record[keep]] = flat_state[step_slots[keep]]
+
+
+def update_state(state, student_idx, correct, kc_idx, trajectory=None, record=None,
+                 predictions=None, **params):
+    '''
+    Apply the steps in the given rows to a matrix of current P(L) values,
+    in place. The P(Li) after, and P(correct) before, each step can be
+    recorded, see apply_steps.
+
+    Input: state, n_students x n_kcs array of P(Li-1) values
+           student_idx, array of student indexes (rows of state), one per row
+           correct, array of Correct flags, one per row
+           kc_idx, array of KC indexes (columns of state, or -1 if none), one per row
+           trajectory, record, predictions, as for apply_steps (optional)
+           params, the same parameters as given to BKTModel (P(L0) not used),
+                   single values or one per KC
+    returns: the updated state
+    '''
+    n_kcs = state.shape[1]
+    kc_idx = np.asarray(kc_idx)
+    rows, keys, bounds = order_by_step(student_idx, kc_idx, n_kcs)
+    apply_steps(state.reshape(-1), keys, rows, bounds, correct, kc_idx,
+                trajectory=trajectory, record=record, predictions=predictions,
+                **kc_params(params, n_kcs))
+    return state
+
+
+def process_batch(student_idx, correct, kc_idx, n_students, n_kcs, sparse=False,
+                  trajectory=None, record=None, predictions=None, **params):
+    '''
+    Calculate the final P(L) of every student for every KC
+
+    With many KCs, most students only ever work on a few of them, and a dense
+    students x KCs matrix is mostly P(L0). In sparse mode only the (student, KC)
+    pairs that have steps are calculated and returned.
+
+    Input: student_idx, array of student indexes (0 to n_students - 1), one per row
+           correct, array of Correct flags, one per row
+           kc_idx, array of KC indexes (0 to n_kcs - 1, or -1 if none), one per row
+           n_students, int, number of students
+           n_kcs, int, number of KCs
+           sparse, bool, whether to return only the pairs with steps (default False)
+           trajectory, record, predictions, to record the P(Li) after or the
+                                            P(correct) before each step, as for
+                                            apply_steps (optional)
+           params, the same initial parameters as given to BKTModel, single
+                   values or one per KC
+    returns: n_students x n_kcs array of final P(L) values, or if sparse, the
+             arrays of student indexes, KC indexes and final P(L) values
+    '''
+    params = kc_params(params, n_kcs)
+    if not sparse:
+        # all the sequences start at P(L0)
+        result = np.empty((n_students, n_kcs), dtype=np.float64)
+        result[:] = params['initial_prob_l']
+        return update_state(result, student_idx, correct, kc_idx,
+                            trajectory=trajectory, record=record,
+                            predictions=predictions, **params)
+
+    # number only the sequences that have steps
+    kc_idx = np.asarray(kc_idx)
+    rows, keys, bounds = order_by_step(student_idx, kc_idx, n_kcs)
+    pairs, slots = np.unique(keys, return_inverse=True)
+    pair_kcs = pairs % n_kcs
+    result = params['initial_prob_l'][pair_kcs].copy()
+    apply_steps(result, slots, rows, bounds, correct, kc_idx,
+                trajectory=trajectory, record=record, predictions=predictions,
+                **params)
+    return pairs // n_kcs, pair_kcs, result
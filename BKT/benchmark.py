@@ -0,0 +1,168 @@
+# Timing and memory measurement
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+try:
+    # memory of worker processes (not on Windows)
+    import resource
+except ImportError:
+    resource = None
+# Vectorized calculations
+import numpy as np
+# Output the benchmark as table
+import pandas as pd
+
+from BKT import BKT
+from cache import cache_path
+from synthetic import write_csv
+
+'''
+BKT benchmark
+
+Simulates data sets of increasing size, from 10^4 rows up to a maximum, and
+times each stage on them: loading (parsing the CSV, then from the binary
+cache), processing with the original per-student BKTModel loop, the batch
+engine and streaming, fitting and evaluation. For each stage the rows per
+second and the peak memory allocated are reported. The results of the loop
+are checked against the batch engine, so a faster engine that drifts from the
+original is caught.
+
+Each stage is timed without tracing memory, as tracing slows Python loops
+far more than NumPy code and would distort the comparison. The peak memory
+is traced in a second run of the stage, and only up to trace_rows rows.
+Tracing only sees the benchmark's own process, so for fitting, which runs on
+a process pool, the largest resident memory of any worker process so far is
+reported too (as Worker MB, where the platform gives it).
+
+The per-student loop is only timed up to loop_rows rows, and fitting up to
+fit_rows rows, as they would take far too long beyond.
+
+Run from the command line, with the maximum number of rows (default 10^6):
+
+>>python benchmark.py 100000000
+'''
+
+PARAMS = {'initial_prob_l': 0.2,
+          'prob_g': 0.25,
+          'prob_s': 0.1,
+          'prob_t': 0.1}
+
+
+def measure(function, *args, trace=True, setup=None, **kwargs):
+    '''
+    Time a function, then trace its peak memory allocation in a second run
+
+    Input: function, the function to call, and its arguments
+           trace, bool, whether to trace the peak memory
+           setup, function to call before each run (optional), such as to
+                  remove a cache the first run wrote
+    returns: the result of the (untraced) function, the seconds taken and
+             the peak memory in bytes (None if not traced)
+    '''
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if trace:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def worker_memory():
+    '''
+    Largest resident memory of any worker process waited for so far
+
+    returns: the memory in bytes, or None if the platform does not give it
+    '''
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def run(max_rows=10**6, n_kcs=5, n_steps=100, loop_rows=10**6, fit_rows=10**7,
+        trace_rows=10**6, n_jobs=None):
+    '''
+    Run the benchmark
+
+    Input: max_rows, int, largest data set, in rows
+           n_kcs, int, number of KCs in the data
+           n_steps, int, number of steps of each student
+           loop_rows, int, largest data set to time the per-student loop on
+           fit_rows, int, largest data set to time fitting on
+           trace_rows, int, largest data set to trace the peak memory on
+           n_jobs, int, number of worker processes for fitting
+    returns: pandas dataframe of the timings
+    '''
+    timings = []
+    sizes = [10**power for power in range(4, 10) if 10**power <= max_rows]
+    with tempfile.TemporaryDirectory() as directory:
+        for n_rows in sizes:
+            file_path = os.path.join(directory, f'synthetic-{n_rows}.csv')
+            write_csv(file_path, n_rows // n_steps, n_kcs, n_steps, **PARAMS)
+            trace = n_rows <= trace_rows
+
+            stages = []
+            bkt = BKT(False, **PARAMS)
+            remove_cache = lambda: shutil.rmtree(cache_path(file_path), ignore_errors=True)
+            stages.append(('load (csv)', measure(bkt.load_csv, file_path, trace=trace,
+                                                 setup=remove_cache)))
+            bkt = BKT(False, **PARAMS)
+            stages.append(('load (cache)', measure(bkt.load_csv, file_path, trace=trace)))
+            batch = measure(bkt.process_students_batch, trace=trace)
+            stages.append(('process (batch)', batch))
+            if n_rows <= loop_rows:
+                # process_students adds to results_matrix, so empty it first
+                loop = measure(bkt.process_students, trace=trace,
+                               setup=lambda: setattr(bkt, 'results_matrix', []))
+                stages.append(('process (loop)', loop))
+                assert np.array_equal(loop[0].values, batch[0].values), \
+                    'batch engine does not match BKTModel!'
+            stages.append(('process (stream)', measure(BKT(False, **PARAMS).process_stream,
+                                                       file_path, trace=trace)))
+            workers = {}
+            if n_rows <= fit_rows:
+                stages.append(('fit (em)', measure(bkt.fit, 'em', n_jobs=n_jobs, trace=trace)))
+                if n_jobs != 1:
+                    workers['fit (em)'] = worker_memory()
+            stages.append(('evaluate', measure(bkt.evaluate, trace=trace)))
+
+            for stage, (_, seconds, peak) in stages:
+                peak_mb = None if peak is None else peak / 2**20
+                worker_mb = None if workers.get(stage) is None else workers[stage] / 2**20
+                timings.append({'Rows': n_rows,
+                                'Stage': stage,
+                                'Seconds': seconds,
+                                'Rows/sec': n_rows / seconds,
+                                'Peak MB': peak_mb,
+                                'Worker MB': worker_mb})
+                memory = '-' if peak_mb is None else f'{peak_mb:.1f}'
+                if worker_mb is not None:
+                    memory += f' (+ workers {worker_mb:.1f})'
+                print(f'{n_rows:>10} {stage:<18} {seconds:10.3f}s '
+                      f'{n_rows / seconds:14,.0f} rows/sec {memory:>10} MB')
+
+    return pd.DataFrame(timings)
+
+
+def main():
+    max_rows = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**6
+    timings = run(max_rows)
+    print(f'\n{timings.pivot(index="Stage", columns="Rows", values="Rows/sec").round()}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Cache files and their metadata
+import os
+import json
+import hashlib
+# Binary columns
+import numpy as np
+
+'''
+Binary cache of a loaded data file
+
+Parsing the CSV text is most of the cost of loading a large data file. So
+once loaded, the columns are saved as .npy files in a directory next to it
+(BKTData.csv.cache for BKTData.csv). Later loads memory-map those columns,
+so only the pages actually used are ever read from disk.
+
+The cache records the size, modification time and SHA-256 hash of the source
+file. If the size or modification time changes the source is hashed again,
+and the cache is only used if the hash still matches.
+'''
+
+# name of the metadata file, written last so a partial cache is never used
+META_FILE = 'meta.json'
+
+
+def cache_path(file_path):
+    '''
+    The cache directory for a data file
+
+    Input: file_path, the file path for the data
+    returns: the path of the cache directory
+    '''
+    return file_path + '.cache'
+
+
+def file_hash(file_path, block_size=1 << 20):
+    '''
+    SHA-256 hash of a file, read in blocks
+
+    Input: file_path, path of the file
+           block_size, int, bytes read at a time
+    returns: hex digest of the hash
+    '''
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as FP:
+        for block in iter(lambda: FP.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cache(file_path):
+    '''
+    Memory-map the cached columns of a data file, if the cache is still valid
+
+    Input: file_path, the file path for the data
+    returns: dictionary of the (read-only, memory-mapped) columns, or None if
+             there is no valid cache
+    '''
+    directory = cache_path(file_path)
+    try:
+        with open(os.path.join(directory, META_FILE), 'r') as FP:
+            meta = json.load(FP)
+    except (OSError, ValueError):
+        return None
+
+    # check the source has not changed, only hashing it if it might have
+    stat = os.stat(file_path)
+    if stat.st_size != meta['size']:
+        return None
+    if stat.st_mtime_ns != meta['mtime']:
+        if file_hash(file_path) != meta['hash']:
+            return None
+        meta['mtime'] = stat.st_mtime_ns
+        write_meta(directory, meta)
+
+    return {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+            for name in meta['columns']}
+
+
+def write_meta(directory, meta):
+    '''
+    Write the metadata file of a cache, replacing any old one in one step
+
+    Input: directory, path of the cache directory
+           meta, dictionary of the metadata
+    '''
+    temp_path = os.path.join(directory, META_FILE + '.tmp')
+    with open(temp_path, 'w') as FP:
+        json.dump(meta, FP)
+    os.replace(temp_path, os.path.join(directory, META_FILE))
+
+
+def save_cache(file_path, columns):
+    '''
+    Save the columns of a loaded data file as its cache
+
+    Input: file_path, the file path for the data
+           columns, dictionary of the column arrays by name
+    '''
+    directory = cache_path(file_path)
+    os.makedirs(directory, exist_ok=True)
+
+    # invalidate any old cache before overwriting its columns
+    meta_path = os.path.join(directory, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    stat = os.stat(file_path)
+    for name, column in columns.items():
+        np.save(os.path.join(directory, name + '.npy'), column)
+
+    write_meta(directory, {'size': stat.st_size,
+                           'mtime': stat.st_mtime_ns,
+                           'hash': file_hash(file_path),
+                           'columns': list(columns)})
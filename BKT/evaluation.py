@@ -0,0 +1,140 @@
+# Vectorized calculations
+import numpy as np
+# Output metrics as table
+import pandas as pd
+from batch import PARAMS, kc_params, process_batch
+from fitting import fit_kcs
+
+'''
+Predictive evaluation of the BKT model
+
+Before each step the model predicts the probability of a correct answer
+from the current P(Li-1):
+
+P(correct) = P(Li-1) * (1 - P(S)) + (1 - P(Li-1)) * P(G)
+
+These predictions are made with the same batch engine as the final P(L)
+values, and scored against the Correct column with AUC, RMSE and log loss,
+all computed with array operations over the whole data set. To judge fitted
+parameters fairly, the students can be split into k folds, fitting on the
+other folds and scoring each fold in turn.
+'''
+
+# keep predictions away from 0 and 1 for the log loss
+EPSILON = 1e-15
+
+
+def predict(student_idx, correct, kc_idx, n_students, n_kcs, **params):
+    '''
+    Predict P(correct) before each step
+
+    Input: student_idx, array of student indexes, one per row
+           correct, array of Correct flags, one per row
+           kc_idx, array of KC indexes (or -1 if none), one per row
+           n_students, int, number of students
+           n_kcs, int, number of KCs
+           params, the same initial parameters as given to BKTModel
+    returns: array of predictions, one per row (NaN for rows without a KC)
+    '''
+    predictions = np.full(len(kc_idx), np.nan)
+    process_batch(student_idx, correct, kc_idx, n_students, n_kcs,
+                  sparse=True, predictions=predictions, **params)
+    return predictions
+
+
+def auc(correct, predictions):
+    '''
+    Area under the ROC curve, from the ranks of the predictions (the
+    Mann-Whitney U statistic), tied predictions sharing their average rank.
+
+    Input: correct, array of Correct flags
+           predictions, array of predicted P(correct)
+    returns: the AUC, NaN if only one class is present
+    '''
+    correct = np.asarray(correct, dtype=bool)
+    n_correct = correct.sum()
+    n_wrong = len(correct) - n_correct
+    if n_correct == 0 or n_wrong == 0:
+        return np.nan
+
+    # average rank of each group of tied predictions
+    order = np.argsort(predictions, kind='stable')
+    ordered = predictions[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    ends = np.r_[starts[1:], len(ordered)]
+    ranks = np.empty(len(ordered))
+    ranks[order] = np.repeat((starts + ends + 1) / 2, ends - starts)
+
+    return (ranks[correct].sum() - n_correct * (n_correct + 1) / 2) / (n_correct * n_wrong)
+
+
+def score(correct, predictions):
+    '''
+    Score the predictions against the actual answers
+
+    Input: correct, array of Correct flags
+           predictions, array of predicted P(correct) (NaN rows are ignored)
+    returns: dictionary of the AUC, RMSE, log loss and number of steps scored
+    '''
+    scored = ~np.isnan(predictions)
+    correct = np.asarray(correct, dtype=np.float64)[scored]
+    predictions = predictions[scored]
+    clipped = np.clip(predictions, EPSILON, 1 - EPSILON)
+    return {'AUC': auc(correct, predictions),
+            'RMSE': np.sqrt(np.mean((correct - predictions) ** 2)),
+            'LogLoss': -np.mean(correct * np.log(clipped)
+                                + (1 - correct) * np.log(1 - clipped)),
+            'Steps': len(correct)}
+
+
+def evaluate(student_idx, correct, kc_idx, n_students, kc_names,
+             n_folds=None, fit_method=None, n_jobs=None, seed=0, **params):
+    '''
+    Evaluate the predictions of the model, either over the whole data set, or
+    split by student into n_folds folds. With fit_method the parameters for
+    each fold are fitted on the students of the other folds, otherwise the
+    given parameters are used throughout, as they are for any KC with no rows
+    in the other folds to fit on.
+
+    Input: student_idx, array of student indexes, one per row
+           correct, array of Correct flags, one per row
+           kc_idx, array of KC indexes (or -1 if none), one per row
+           n_students, int, number of students
+           kc_names, list of the KC names
+           n_folds, int, number of folds (optional)
+           fit_method, string {'grid', 'em'}, fitting method (optional)
+           n_jobs, int, number of worker processes for fitting
+           seed, int, seed for the random assignment of students to folds
+           params, the initial parameters as given to BKTModel
+    returns: pandas dataframe of the scores, one row per fold and one overall
+    '''
+    student_idx = np.asarray(student_idx)
+    correct = np.asarray(correct)
+    kc_idx = np.asarray(kc_idx)
+    n_kcs = len(kc_names)
+
+    if n_folds is None:
+        predictions = predict(student_idx, correct, kc_idx, n_students, n_kcs, **params)
+        return pd.DataFrame([score(correct, predictions)], index=['All'])
+
+    # randomly assign the students to folds of (nearly) equal size
+    rng = np.random.default_rng(seed)
+    folds = rng.permutation(np.arange(n_students) % n_folds)[student_idx]
+
+    defaults = kc_params(params, n_kcs)
+    scores = []
+    predictions = np.full(len(kc_idx), np.nan)
+    for fold in range(n_folds):
+        test = folds == fold
+        fold_params = params
+        if fit_method is not None:
+            fitted = fit_kcs(student_idx[~test], correct[~test], kc_idx[~test], kc_names,
+                             method=fit_method, n_jobs=n_jobs)
+            fold_params = {name: np.where(np.isnan(fitted[name].to_numpy()),
+                                          defaults[name], fitted[name].to_numpy())
+                           for name in PARAMS}
+        predictions[test] = predict(student_idx[test], correct[test], kc_idx[test],
+                                    n_students, n_kcs, **fold_params)
+        scores.append(score(correct[test], predictions[test]))
+    scores.append(score(correct, predictions))
+    return pd.DataFrame(scores, index=[f'Fold {i + 1}' for i in range(n_folds)] + ['All'])
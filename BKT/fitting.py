@@ -0,0 +1,253 @@
+# Fitting the KCs in parallel
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+# Vectorized calculations
+import numpy as np
+# Output fitted parameters as table
+import pandas as pd
+from batch import PARAMS, order_by_step, prob_correct
+
+'''
+Fitting the BKT parameters
+
+The four parameters P(L0), P(G), P(S) and P(T) are fitted separately for
+each KC, by maximizing the likelihood of the observed Correct values. Two
+methods are offered:
+
+grid: brute force search. A whole block of parameter combinations is scored
+      at once, the P(L) values for every combination and student held in one
+      matrix and updated a step at a time with the batch engine.
+em:   the Expectation-Maximization (Baum-Welch) algorithm, treating each
+      student's steps on the KC as a two state hidden Markov model.
+
+The KCs are independent, so fit_kcs fans them out across a process pool.
+'''
+
+# keep probabilities away from 0 and 1, so no denominator is ever zero
+EPSILON = 1e-6
+
+DEFAULT_GRID = {'initial_prob_l': np.linspace(0.05, 0.95, 10),
+                'prob_g': np.linspace(0.05, 0.45, 9),
+                'prob_s': np.linspace(0.05, 0.45, 9),
+                'prob_t': np.linspace(0.05, 0.95, 10)}
+
+
+def kc_sequences(student_idx, correct):
+    '''
+    Arrange the rows of a single KC by step, the sequence of each student
+    being numbered from 0.
+
+    Input: student_idx, array of student indexes, one per row
+           correct, array of Correct flags, one per row
+    returns: seqs, sequence number of each row in processing order
+             correct, the Correct flags in processing order
+             bounds, array so rows bounds[k]:bounds[k + 1] are the k-th steps
+             n_seqs, number of sequences (students)
+    '''
+    students, seqs = np.unique(student_idx, return_inverse=True)
+    rows, seqs, bounds = order_by_step(seqs, np.zeros(len(seqs), dtype=np.int64), 1)
+    correct = np.asarray(correct, dtype=bool)[rows]
+    return seqs, correct, bounds, len(students)
+
+
+def grid_search(student_idx, correct, grid=None, max_cells=2**22):
+    '''
+    Score every combination of parameters in a grid by log likelihood, as
+    many combinations at a time as fit in max_cells P(L) values, and return
+    the best.
+
+    Input: student_idx, array of student indexes, one per row of the KC
+           correct, array of Correct flags, one per row of the KC
+           grid, dictionary of candidate values for each parameter (optional)
+           max_cells, int, bound on the size of the combinations x students matrix
+    returns: dictionary of the best parameters and their log likelihood
+    '''
+    if grid is None:
+        grid = DEFAULT_GRID
+    combos = np.array(list(product(*[grid[param] for param in PARAMS])), dtype=np.float64)
+    seqs, correct, bounds, n_seqs = kc_sequences(student_idx, correct)
+    block_size = max(1, max_cells // max(1, n_seqs))
+
+    best = None
+    for start in range(0, len(combos), block_size):
+        # one column vector per parameter, broadcast against the sequences
+        block = combos[start:start + block_size]
+        prob_l0, prob_g, prob_s, prob_t = [block[:, [i]] for i in range(4)]
+        state = np.repeat(prob_l0, n_seqs, axis=1)
+        log_likelihood = np.zeros(len(block))
+
+        for k in range(len(bounds) - 1):
+            step_seqs = seqs[bounds[k]:bounds[k + 1]]
+            step_correct = correct[bounds[k]:bounds[k + 1]]
+
+            # when every sequence has a k-th step, avoid the fancy indexing
+            if len(step_seqs) == n_seqs:
+                step_seqs = slice(None)
+
+            # the same update as calc_update, keeping the denominator, which
+            # is the probability of the observed answer
+            previous_p_l = state[:, step_seqs]
+            s = np.where(step_correct, 1 - prob_s, prob_s)
+            g = np.where(step_correct, prob_g, 1 - prob_g)
+            enumerator = previous_p_l * s
+            denominator = enumerator + (1 - previous_p_l) * g
+            log_likelihood += np.log(denominator).sum(axis=1)
+            prob_l_1 = enumerator / denominator
+            state[:, step_seqs] = prob_l_1 + (1 - prob_l_1) * prob_t
+
+        i = np.argmax(log_likelihood)
+        if best is None or log_likelihood[i] > best['log_likelihood']:
+            best = dict(zip(PARAMS, block[i].tolist()))
+            best['log_likelihood'] = log_likelihood[i]
+    return best
+
+
+def em_fit(student_idx, correct, initial_params=None, max_iter=100, tol=1e-6,
+           max_guess=0.5, max_slip=0.5):
+    '''
+    Fit the parameters with Expectation-Maximization (Baum-Welch)
+
+    Each iteration runs a forward pass, which is the usual BKT update, and a
+    backward smoothing pass over all the sequences at once, then re-estimates
+    the parameters from the expected counts.
+
+    Input: student_idx, array of student indexes, one per row of the KC
+           correct, array of Correct flags, one per row of the KC
+           initial_params, dictionary of starting parameters (optional)
+           max_iter, int, maximum number of iterations
+           tol, float, stop when the log likelihood improves less than this
+           max_guess, max_slip, float, upper bounds on P(G) and P(S). Keeping
+                      them below 0.5 avoids the degenerate solutions where the
+                      'known' state predicts wrong answers.
+    returns: dictionary of the fitted parameters and their log likelihood
+    '''
+    if initial_params is None:
+        initial_params = {'initial_prob_l': 0.2, 'prob_g': 0.25,
+                          'prob_s': 0.1, 'prob_t': 0.1}
+    params = {param: initial_params[param] for param in PARAMS}
+    seqs, correct, bounds, n_seqs = kc_sequences(student_idx, correct)
+    n_steps = len(bounds) - 1
+
+    previous_log_likelihood = -np.inf
+    for _ in range(max_iter):
+        prob_g, prob_s, prob_t = params['prob_g'], params['prob_s'], params['prob_t']
+
+        # forward pass: P(L) before (prior) and after (posterior) each step
+        prior = np.empty(len(seqs))
+        posterior = np.empty(len(seqs))
+        state = np.full(n_seqs, params['initial_prob_l'])
+        log_likelihood = 0.0
+        for k in range(n_steps):
+            step = slice(bounds[k], bounds[k + 1])
+            step_seqs = seqs[step]
+            p_l = state[step_seqs]
+            p = prob_correct(p_l, prob_g, prob_s)
+            p = np.where(correct[step], p, 1 - p)
+            known = np.where(correct[step], 1 - prob_s, prob_s)
+            prior[step] = p_l
+            posterior[step] = p_l * known / p
+            log_likelihood += np.log(p).sum()
+            state[step_seqs] = posterior[step] + (1 - posterior[step]) * prob_t
+
+        if log_likelihood - previous_log_likelihood < tol:
+            break
+        previous_log_likelihood = log_likelihood
+
+        # backward pass: smoothed P(L) given all the steps of the sequence,
+        # and expected number of unknown -> known transitions
+        smoothed = np.empty(len(seqs))
+        learned = 0.0
+        unknown = 0.0
+        next_smoothed = np.empty(n_seqs)
+        next_prior = np.empty(n_seqs)
+        for k in range(n_steps - 1, -1, -1):
+            step = slice(bounds[k], bounds[k + 1])
+            step_seqs = seqs[step]
+            if k == n_steps - 1:
+                smoothed[step] = posterior[step]
+            else:
+                # sequences continuing to step k + 1 are a subset of those at step k
+                has_next = np.zeros(n_seqs, dtype=bool)
+                has_next[seqs[bounds[k + 1]:bounds[k + 2]]] = True
+                has_next = has_next[step_seqs]
+                f = posterior[step]
+                g_next = next_smoothed[step_seqs]
+                p_next = np.clip(next_prior[step_seqs], EPSILON, 1 - EPSILON)
+                stay = (1 - f) * (1 - prob_t) * (1 - g_next) / (1 - p_next)
+                learn = (1 - f) * prob_t * g_next / p_next
+                smoothed[step] = np.where(has_next, 1 - stay - learn, f)
+                learned += learn[has_next].sum()
+                unknown += (stay + learn)[has_next].sum()
+            next_smoothed[step_seqs] = smoothed[step]
+            next_prior[step_seqs] = prior[step]
+
+        # maximization
+        not_known = 1 - smoothed
+        params = {'initial_prob_l': smoothed[:bounds[1]].mean(),
+                  'prob_g': not_known[correct].sum() / not_known.sum(),
+                  'prob_s': smoothed[~correct].sum() / smoothed.sum(),
+                  'prob_t': learned / unknown if unknown > 0 else prob_t}
+        params = {param: float(np.clip(value, EPSILON, 1 - EPSILON))
+                  for param, value in params.items()}
+        params['prob_g'] = min(params['prob_g'], max_guess)
+        params['prob_s'] = min(params['prob_s'], max_slip)
+
+    params['log_likelihood'] = log_likelihood
+    return params
+
+
+def fit_kc(student_idx, correct, method='grid', **options):
+    '''
+    Fit the parameters of a single KC
+
+    Input: student_idx, array of student indexes, one per row of the KC
+           correct, array of Correct flags, one per row of the KC
+           method, string {'grid', 'em'}
+           options, passed on to grid_search or em_fit
+    returns: dictionary of the fitted parameters and their log likelihood
+             (all NaN if the KC has no rows to fit on)
+    '''
+    if method not in ('grid', 'em'):
+        raise ValueError('Invalid fitting method')
+    if len(correct) == 0:
+        return dict.fromkeys(PARAMS + ['log_likelihood'], np.nan)
+    if method == 'grid':
+        return grid_search(student_idx, correct, **options)
+    else:
+        return em_fit(student_idx, correct, **options)
+
+
+def fit_kcs(student_idx, correct, kc_idx, kc_names, method='grid', n_jobs=None, **options):
+    '''
+    Fit the parameters of every KC, in parallel over a process pool
+
+    Input: student_idx, array of student indexes, one per row
+           correct, array of Correct flags, one per row
+           kc_idx, array of KC indexes (or -1 if none), one per row
+           kc_names, list of the KC names
+           method, string {'grid', 'em'}
+           n_jobs, int, number of worker processes (default is all the cores,
+                   1 fits in this process)
+           options, passed on to grid_search or em_fit
+    returns: pandas DataFrame of the fitted parameters, one row per KC (NaN
+             for a KC with no rows)
+    '''
+    student_idx = np.asarray(student_idx)
+    correct = np.asarray(correct, dtype=bool)
+    kc_idx = np.asarray(kc_idx)
+    # Split the rows by KC once (a stable sort keeps each KC's rows in order)
+    order = np.argsort(kc_idx, kind='stable')
+    bounds = np.searchsorted(kc_idx[order], np.arange(len(kc_names) + 1))
+    student_idx = student_idx[order]
+    correct = correct[order]
+    tasks = [(student_idx[start:stop], correct[start:stop])
+             for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    if n_jobs == 1:
+        fitted = [fit_kc(*task, method=method, **options) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(fit_kc, *task, method=method, **options) for task in tasks]
+            fitted = [future.result() for future in futures]
+
+    return pd.DataFrame(fitted, index=kc_names, columns=PARAMS + ['log_likelihood'])
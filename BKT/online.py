@@ -0,0 +1,124 @@
+# Saving snapshots safely
+import os
+# Vectorized calculations
+import numpy as np
+from batch import PARAMS, calc_update, kc_params, update_state
+from streaming import StreamingBKT
+
+'''
+OnlineBKT class
+
+Keeps the current P(L) of every student for every KC, so new responses can
+be applied as they arrive rather than replaying each student's history. A
+single event is an O(1) update of one element of the state matrix, and a
+micro-batch of events is applied with the vectorized batch engine.
+
+The state can be saved to disk as a snapshot and restored on restart. The
+state can also be built up first from a historical log with process_file.
+'''
+class OnlineBKT(StreamingBKT):
+    def __init__(self, kc_names=None, **params):
+        '''
+        Constructor
+
+        Input: kc_names, list of the KC names (optional if a snapshot is
+                         to be loaded)
+               params, the same initial parameters as given to BKTModel, single
+                       values or one per KC
+        '''
+        super().__init__(kc_names, **params)
+
+    def update(self, student, correct, kc_index):
+        '''
+        Apply a single response
+
+        Input: student, the student ID
+               correct, the Correct flag of the response
+               kc_index, int, index of the KC of the step
+        returns: the updated P(L) of that student for that KC
+        '''
+        if not 0 <= kc_index < len(self.kcs):
+            raise ValueError(f'Invalid KC index {kc_index}')
+        index = self.student_index.get(student)
+        if index is None:
+            index = self.index_students([student])[0]
+
+        params = kc_params(self.params, len(self.kcs))
+        prob_l = calc_update(self.state[index, kc_index], correct,
+                             params['prob_g'][kc_index],
+                             params['prob_s'][kc_index],
+                             params['prob_t'][kc_index])
+        self.state[index, kc_index] = prob_l
+        return float(prob_l)
+
+    def update_batch(self, students, correct, kc_idx):
+        '''
+        Apply a micro-batch of responses, in order
+
+        Input: students, list of student IDs, one per response
+               correct, array of Correct flags, one per response
+               kc_idx, array of KC indexes (or -1 if none), one per response
+        returns: array of the updated P(L) for each response's student and KC
+                 (NaN for responses without a KC)
+        '''
+        kc_idx = np.asarray(kc_idx, dtype=np.int64)
+        if np.any((kc_idx < -1) | (kc_idx >= len(self.kcs))):
+            raise ValueError('Invalid KC index')
+        student_idx = self.index_students(students)
+        update_state(self.state[:len(self.students)], student_idx, correct, kc_idx,
+                     **self.params)
+
+        prob_l = np.full(len(kc_idx), np.nan)
+        has_kc = kc_idx >= 0
+        prob_l[has_kc] = self.state[student_idx[has_kc], kc_idx[has_kc]]
+        return prob_l
+
+    def mastery(self, student):
+        '''
+        Current P(L) of a student for each KC
+
+        Input: student, the student ID
+        returns: array of P(L) values, P(L0) for a student not seen yet
+        '''
+        index = self.student_index.get(student)
+        if index is None:
+            return kc_params(self.params, len(self.kcs))['initial_prob_l'].copy()
+        return self.state[index].copy()
+
+    def save_snapshot(self, file_path):
+        '''
+        Save the current state to disk, as a NumPy .npz file. The file is
+        written alongside and then renamed, so a crash while saving never
+        leaves a partial snapshot.
+
+        Input: file_path, path of the snapshot file
+        '''
+        params = kc_params(self.params, len(self.kcs))
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'wb') as FP:
+            np.savez(FP,
+                     students=np.array(self.students, dtype=str),
+                     kcs=np.array(self.kcs, dtype=str),
+                     state=self.state[:len(self.students)],
+                     params=np.array([params[name] for name in PARAMS]))
+        os.replace(temp_path, file_path)
+
+    def load_snapshot(self, file_path):
+        '''
+        Restore the state saved with save_snapshot, replacing the current one
+
+        Input: file_path, path of the snapshot file
+        '''
+        with np.load(file_path) as snapshot:
+            students = snapshot['students'].tolist()
+            kcs = snapshot['kcs'].tolist()
+            self.params = dict(zip(PARAMS, snapshot['params']))
+            state = snapshot['state']
+
+        # rebuild the indexes, then copy in the saved state
+        self.students, self.kcs = [], []
+        self.student_index, self.kc_index = {}, {}
+        self.state = None
+        self.index_kcs(kcs)
+        self.index_students(students)
+        self.state[:len(state)] = state
@@ -0,0 +1,134 @@
+# Reading the log in chunks
+import pandas as pd
+# Vectorized calculations
+import numpy as np
+from batch import encode_kcs, kc_params, update_state
+
+'''
+StreamingBKT class
+
+Processes a data file too large to hold in memory. The file is read in
+chunks of a bounded number of rows, and only the current P(L) of each
+student for each KC is kept between chunks. A student whose rows cross
+the boundary between two chunks just carries on from the state left by
+the previous chunk, so the results are the same as processing the whole
+file at once. Memory use thus depends on the number of students, not the
+number of rows.
+
+The data file can have either one-hot KCn columns, or a single KC column
+with the name of the KC for each row. In the latter case, unless the KC
+names are given up front, KCs are added as they first appear.
+'''
+class StreamingBKT:
+    def __init__(self, kc_names=None, **params):
+        '''
+        Constructor
+
+        Input: kc_names, list of the KC names (optional, taken from the data
+                         if not given)
+               params, the same initial parameters as given to BKTModel, single
+                       values or one per KC (needs kc_names)
+        '''
+        self.params = params
+        self.students = []
+        self.kcs = []
+
+        # index of each student's row, and each KC's column, in the state matrix
+        self.student_index = {}
+        self.kc_index = {}
+        self.state = None
+        if kc_names is not None:
+            self.index_kcs(kc_names)
+
+    def __grow(self, n_students, n_kcs):
+        '''
+        Make room in the state matrix for n_students and n_kcs, doubling its
+        capacity as needed so growing is amortized over many students.
+
+        Input: n_students, int, number of students to hold
+               n_kcs, int, number of KCs to hold
+        '''
+        if self.state is None:
+            self.state = np.empty((0, n_kcs), dtype=np.float64)
+        capacity = max(len(self.state), 1024)
+        while capacity < n_students:
+            capacity *= 2
+        if capacity == len(self.state) and n_kcs == self.state.shape[1]:
+            return
+
+        # new students and KCs start at P(L0)
+        state = np.empty((capacity, n_kcs), dtype=np.float64)
+        state[:] = kc_params(self.params, n_kcs)['initial_prob_l']
+        state[:len(self.state), :self.state.shape[1]] = self.state
+        self.state = state
+
+    def index_students(self, students):
+        '''
+        Find the row of the state matrix for each student, adding any
+        not seen before.
+
+        Input: students, list of student IDs
+        returns: array of indexes into the state matrix
+        '''
+        lookup = np.empty(len(students), dtype=np.int64)
+        for i, student in enumerate(students):
+            index = self.student_index.get(student)
+            if index is None:
+                index = len(self.students)
+                self.student_index[student] = index
+                self.students.append(student)
+            lookup[i] = index
+        self.__grow(len(self.students), len(self.kcs))
+        return lookup
+
+    def index_kcs(self, kcs):
+        '''
+        Find the column of the state matrix for each KC, adding any
+        not seen before.
+
+        Input: kcs, list of KC names
+        returns: array of indexes into the state matrix
+        '''
+        lookup = np.empty(len(kcs), dtype=np.int64)
+        for i, kc in enumerate(kcs):
+            index = self.kc_index.get(kc)
+            if index is None:
+                index = len(self.kcs)
+                self.kc_index[kc] = index
+                self.kcs.append(kc)
+            lookup[i] = index
+        self.__grow(len(self.students), len(self.kcs))
+        return lookup
+
+    def process_chunk(self, chunk):
+        '''
+        Apply one chunk of rows to the current state
+
+        Input: chunk, pandas DataFrame with the same columns as the data file
+        '''
+        # the KC of each row, as an index (-1 if none)
+        codes, kcs = encode_kcs(chunk)
+        kc_idx = np.append(self.index_kcs(kcs), -1)[codes]
+
+        # code the students in this chunk, adding any not seen before
+        codes, students = pd.factorize(chunk.iloc[:, 0])
+        student_idx = self.index_students(students)[codes]
+
+        update_state(self.state[:len(self.students)],
+                     student_idx,
+                     chunk.iloc[:, 2].to_numpy(),
+                     kc_idx,
+                     **self.params)
+
+    def process_file(self, file_path, chunk_size=100000):
+        '''
+        Stream a whole data file, chunk_size rows at a time
+
+        Input: file_path, the file path for the data
+               chunk_size, int, maximum number of rows held in memory
+        returns: n_students x n_kcs array of final P(L) values
+        '''
+        with pd.read_csv(file_path, dtype={0: str}, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                self.process_chunk(chunk)
+        return self.state[:len(self.students)]
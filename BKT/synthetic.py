@@ -0,0 +1,80 @@
+# Vectorized simulation
+import numpy as np
+# Writing the data file
+import pandas as pd
+
+'''
+Synthetic BKT data
+
+Simulates students under known BKT parameters, so there is data of any size
+to test and benchmark with, and fitting can be checked against the true
+parameters. Each student starts knowing each KC with probability P(L0). At
+each step the student works on a random KC, answers correctly with
+probability 1 - P(S) if they know it or P(G) if not, and then learns it with
+probability P(T). All the students take their steps together, as arrays.
+'''
+
+
+def simulate(n_students, n_kcs, n_steps, seed=0, **params):
+    '''
+    Simulate the responses of students
+
+    Input: n_students, int, number of students
+           n_kcs, int, number of KCs
+           n_steps, int, number of steps per student
+           seed, int, seed for the random number generator
+           params, the true parameters, as given to BKTModel
+    returns: student_idx, correct and kc_idx arrays, one row per step, with
+             the rows of each student together and in order
+    '''
+    rng = np.random.default_rng(seed)
+    students = np.arange(n_students)
+    known = rng.random((n_students, n_kcs)) < params['initial_prob_l']
+
+    correct = np.empty((n_students, n_steps), dtype=np.int8)
+    kc_idx = rng.integers(0, n_kcs, size=(n_students, n_steps), dtype=np.int32)
+    for step in range(n_steps):
+        kcs = kc_idx[:, step]
+        knows = known[students, kcs]
+        draw = rng.random(n_students)
+        correct[:, step] = np.where(knows, draw >= params['prob_s'], draw < params['prob_g'])
+
+        # learning, if not known already, after the response
+        known[students, kcs] = knows | (rng.random(n_students) < params['prob_t'])
+
+    return np.repeat(students, n_steps), correct.reshape(-1), kc_idx.reshape(-1)
+
+
+def write_csv(file_path, n_students, n_kcs, n_steps, seed=0, one_hot=True,
+              chunk_students=10000, **params):
+    '''
+    Write a simulated data file, in the same format as BKTData.csv. The
+    students are simulated and written a chunk at a time, so files larger
+    than memory can be written.
+
+    Input: file_path, path of the file to write
+           n_students, int, number of students
+           n_kcs, int, number of KCs
+           n_steps, int, number of steps per student
+           seed, int, seed for the random number generator
+           one_hot, bool, whether to write KC_n columns (default True), or a
+                    single KC column
+           chunk_students, int, number of students simulated at a time
+           params, the true parameters, as given to BKTModel
+    '''
+    first = True
+    for chunk, start in enumerate(range(0, n_students, chunk_students)):
+        count = min(chunk_students, n_students - start)
+        student_idx, correct, kc_idx = simulate(count, n_kcs, n_steps,
+                                                seed=(seed, chunk), **params)
+        frame = pd.DataFrame({'Student': np.char.add('stu', (student_idx + start + 1).astype(str)),
+                              'StepID': np.tile(np.arange(1, n_steps + 1), count),
+                              'Correct': correct})
+        if one_hot:
+            for kc in range(n_kcs):
+                frame[f'KC_{kc + 1}'] = (kc_idx == kc).astype(np.int8)
+        else:
+            frame['KC'] = np.char.add('KC_', (kc_idx + 1).astype(str))
+
+        frame.to_csv(file_path, mode='w' if first else 'a', header=first, index=False)
+        first = False
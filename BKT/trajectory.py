@@ -0,0 +1,74 @@
+# Trajectory files
+import os
+# Columns of the trajectory
+import numpy as np
+# Output trajectories as table
+import pandas as pd
+
+'''
+Trajectory files
+
+The P(Li) after every recorded step is written into a preallocated array,
+either in memory or, for large data sets, as a memory-mapped .npy file. A
+trajectory file is a directory of .npy columns: the student, StepID, KC and
+P(L) of each recorded step, plus the student and KC names. It can be read
+back as a table with load_trajectory, without parsing any text.
+'''
+
+
+def allocate_trajectory(n_rows, directory=None):
+    '''
+    Preallocate the P(L) column of a trajectory
+
+    Input: n_rows, int, number of steps to be recorded
+           directory, path of the trajectory directory (optional, in memory
+                      if not given)
+    returns: the array for the P(L) values
+    '''
+    if directory is None:
+        return np.empty(n_rows, dtype=np.float64)
+    os.makedirs(directory, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(directory, 'p_l.npy'),
+                                     mode='w+', dtype=np.float64, shape=(int(n_rows),))
+
+
+def trajectory_table(columns):
+    '''
+    Make a table of the trajectory, one row per recorded step
+
+    Input: columns, dictionary of the trajectory columns
+    returns: pandas dataframe of the Student, StepID, KC and P(L) columns
+    '''
+    return pd.DataFrame({'Student': pd.Categorical.from_codes(columns['student_codes'],
+                                                              columns['students']),
+                         'StepID': columns['steps'],
+                         'KC': pd.Categorical.from_codes(columns['kc_idx'],
+                                                         columns['kcs']),
+                         'P(L)': columns['p_l']})
+
+
+def save_trajectory(directory, columns):
+    '''
+    Write the columns of a trajectory, other than the P(L) values already
+    written in place
+
+    Input: directory, path of the trajectory directory
+           columns, dictionary of the trajectory columns
+    '''
+    for name, column in columns.items():
+        if name != 'p_l':
+            np.save(os.path.join(directory, name + '.npy'), column)
+    columns['p_l'].flush()
+
+
+def load_trajectory(directory):
+    '''
+    Read back a trajectory file, memory-mapping its columns
+
+    Input: directory, path of the trajectory directory
+    returns: pandas dataframe of the Student, StepID, KC and P(L) columns
+    '''
+    names = ['students', 'kcs', 'student_codes', 'steps', 'kc_idx', 'p_l']
+    columns = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+               for name in names}
+    return trajectory_table(columns)
@@ -0,0 +1,224 @@
+# finding the maze files
+import os
+import sys
+import glob
+import json
+import time
+# solving in parallel
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+
+from maze import Maze, load_solution
+
+'''
+Batch solver
+
+Solves every maze file in a directory (or matching a glob pattern) across a
+process pool, each worker loading and solving one maze file at a time. The
+results are written as JSON lines as soon as each maze is solved, one line
+per maze and search method: the path, its length, whether it is a legal path
+and whether it is the expected solution (if there is a -solution file for
+the maze), and the seconds taken to load and solve. A file that can not be
+loaded as a maze gives a single line with its error instead, as does a
+search method that fails on a maze, and the other files are still solved.
+If a worker process dies (for example killed for running out of memory on
+a huge maze), the files it may have had are solved again one at a time in
+processes of their own, so only the file that kills its process fails, and
+the rest carry on in a new pool.
+Only a bounded number of mazes are submitted to the pool at once, so memory
+does not grow with the number of files.
+
+Given a directory, only the files named like mazes are solved: .txt files
+with 'maze' in their name (in any case), other than -solution files, and
+binary .jmaze files. Other files, such as Readme.txt, are skipped. Give a
+glob pattern to solve files named otherwise.
+
+Run from the command line, with the directory or a quoted glob pattern, and
+optionally the search methods (default A*):
+
+>>python batch.py mazes
+>>python batch.py "mazes/*-maze.txt" DFS BFS A*
+'''
+
+
+def find_mazes(pattern):
+    '''
+    Find the maze files to solve
+    input: pattern, a directory (every .txt file in it with 'maze' in its
+           name and every binary .jmaze file, other than solution files) or
+           a glob pattern
+    return: sorted list of file paths
+    '''
+    if os.path.isdir(pattern):
+        file_paths = [file_path for file_path in glob.glob(os.path.join(pattern, '*.txt'))
+                      if 'maze' in os.path.basename(file_path).lower()]
+        file_paths += glob.glob(os.path.join(pattern, '*.jmaze'))
+    else:
+        file_paths = glob.glob(pattern)
+    return sorted(file_path for file_path in file_paths
+                  if not file_path.endswith('-solution.txt'))
+
+
+def solution_path(maze_file):
+    '''
+    The solution file for a maze file, as named for the examples:
+    4x4Maze-maze.txt -> 4x4Maze-solution.txt, 6x6Maze.txt -> 6x6Maze-solution.txt
+    (and the same for binary .jmaze files)
+    input: maze_file, path of the maze file
+    return: path of the solution file
+    '''
+    root = os.path.splitext(maze_file)[0]
+    if root.endswith('-maze'):
+        root = root[:-len('-maze')]
+    return root + '-solution.txt'
+
+
+def error_result(maze_file, error, method=None):
+    '''
+    The result for a maze file that could not be loaded or solved
+    input: maze_file, path of the maze file
+           error, the exception raised
+           method, the search method that failed (optional)
+    return: dictionary of the file, the method and the error
+    '''
+    result = {'file': maze_file}
+    if method is not None:
+        result['method'] = method
+    result['error'] = f'{type(error).__name__}: {error}'
+    return result
+
+
+def solve_file(maze_file, methods):
+    '''
+    Load and solve one maze file (run in the worker processes)
+    input: maze_file, path of the maze file
+           methods, list of search methods, as given to Maze.solve_maze
+    return: list of results, a dictionary for each method (or a single
+            dictionary of the error, if the file could not be loaded)
+    '''
+    begin = time.perf_counter()
+    maze = Maze()
+    try:
+        maze.load_maze(maze_file)
+        solution = None
+        if os.path.exists(solution_path(maze_file)):
+            solution = load_solution(solution_path(maze_file))
+    except Exception as error:
+        return [error_result(maze_file, error)]
+    load_seconds = time.perf_counter() - begin
+
+    results = []
+    for method in methods:
+        try:
+            path = maze.solve_maze(method, False)
+            legal = maze.check_path(path)
+        except Exception as error:
+            results.append(error_result(maze_file, error, method))
+            continue
+        results.append({'file': maze_file,
+                        'method': method,
+                        'path': path,
+                        'length': len(path),
+                        'legal': legal,
+                        'as_expected': None if solution is None else path == solution,
+                        'load_seconds': load_seconds,
+                        'seconds': maze.stats['seconds']})
+    return results
+
+
+def solve_files(files, methods=('A*',), n_jobs=None, max_pending=None):
+    '''
+    Solve many maze files over a process pool, yielding the results in the
+    order the mazes are solved.
+    input: files, iterable of maze file paths
+           methods, list of search methods, as given to Maze.solve_maze
+           n_jobs, int, number of worker processes (default is all the cores,
+                   1 solves in this process)
+           max_pending, int, most mazes submitted to the pool at once
+                        (default is twice the number of workers)
+    return: generator of results, a dictionary per maze and method
+    '''
+    methods = list(methods)
+    if n_jobs == 1:
+        for maze_file in files:
+            yield from solve_file(maze_file, methods)
+        return
+
+    n_jobs = n_jobs or os.cpu_count()
+    max_pending = max_pending or 2 * n_jobs
+    files = iter(files)
+    while True:
+        # files whose worker died, and files not submitted as the pool broke
+        suspects = []
+        unsubmitted = []
+        broken = False
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            # the maze file of each future not yet done
+            pending = {}
+            while not broken:
+                # keep the pool busy, without queueing every file at once
+                for maze_file in files:
+                    try:
+                        future = pool.submit(solve_file, maze_file, methods)
+                    except BrokenProcessPool:
+                        unsubmitted.append(maze_file)
+                        broken = True
+                        break
+                    pending[future] = maze_file
+                    if len(pending) >= max_pending:
+                        break
+                if len(pending) == 0:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    maze_file = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool:
+                        suspects.append(maze_file)
+                        broken = True
+                        continue
+                    except Exception as error:
+                        results = [error_result(maze_file, error)]
+                    yield from results
+            suspects.extend(pending.values())
+
+        if not broken:
+            return
+
+        # A worker died (for example killed running out of memory), which
+        # breaks the whole pool, so it is not known which of the files it
+        # had was the cause. Solve each of those alone, so only that file
+        # fails, then carry on with the rest in a new pool.
+        for maze_file in suspects:
+            yield from solve_alone(maze_file, methods)
+        files = chain(unsubmitted, files)
+
+
+def solve_alone(maze_file, methods):
+    '''
+    Solve one maze file in a process of its own, so a crash of that process
+    only gives an error for this file
+    input: maze_file, path of the maze file
+           methods, list of search methods, as given to Maze.solve_maze
+    return: list of results, as from solve_file
+    '''
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return pool.submit(solve_file, maze_file, methods).result()
+        except Exception as error:
+            return [error_result(maze_file, error)]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('usage: python batch.py <directory or glob> [method ...]')
+        sys.exit(1)
+    methods = sys.argv[2:] or ['A*']
+    for result in solve_files(find_mazes(sys.argv[1]), methods):
+        print(json.dumps(result), flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# for command line arguments
+import sys
+import time
+# the size of each maze
+import math
+
+from generator import generate_maze
+
+'''
+Search benchmark
+
+Generates mazes from 10^2 squares up to a maximum (default 10^6), and solves
+each with every search method: DFS, BFS, A* (with the Manhattan and zero
+heuristics) and walking the distance field. For each it records the time
+taken, the nodes expanded and the peak memory allocated, as well as the
+time to build the jump graph and the distance field, which are shared by
+the searches. Memory is traced in a second run of each search, as tracing
+slows the search down, and only up to trace_cells squares.
+
+Every path is checked to be legal, and the optimal methods are checked to
+agree: BFS and the distance field on the least number of moves, and A* with
+either heuristic on the least squares jumped.
+
+Run from the command line, with the maximum number of squares:
+
+>>python benchmark.py 10000000
+'''
+
+METHODS = [('DFS', 'manhattan'),
+           ('BFS', 'manhattan'),
+           ('A*', 'manhattan'),
+           ('A*', 'zero'),
+           ('Field', 'manhattan')]
+
+
+def path_cost(maze, path):
+    '''
+    The squares jumped along a path, as minimized by A*
+    input: maze, the Maze object
+           path, list of (y, x) tuples
+    return: int, the sum of the jumps
+    '''
+    return sum(int(maze.jumps[cell]) for cell in path[:-1])
+
+
+def run(max_cells=10**6, trace_cells=10**6, max_jump=None, density=0.8, seed=0):
+    '''
+    Run the benchmark
+    input: max_cells, int, largest maze, in squares
+           trace_cells, int, largest maze to trace the peak memory of
+           max_jump, density, seed, as for generate_maze
+    return: list of dictionaries of the results, one per maze and method
+    '''
+    results = []
+    sizes = [10**power for power in range(2, 8) if 10**power <= max_cells]
+    for n_cells in sizes:
+        side = math.isqrt(n_cells)
+        maze = generate_maze(side, side, max_jump, density, seed)
+
+        begin = time.perf_counter()
+        maze.build_graph()
+        graph_seconds = time.perf_counter() - begin
+        begin = time.perf_counter()
+        maze.build_distance_field()
+        field_seconds = time.perf_counter() - begin
+        print(f'{n_cells:>10} {"graph":<14} {graph_seconds:10.3f}s')
+        print(f'{n_cells:>10} {"field":<14} {field_seconds:10.3f}s')
+
+        paths = {}
+        for method, heuristic in METHODS:
+            name = method if method != 'A*' else f'A* ({heuristic})'
+            path = maze.solve_maze(method, False, heuristic=heuristic)
+            stats = maze.stats
+            peak = None
+            if n_cells <= trace_cells:
+                maze.solve_maze(method, False, heuristic=heuristic, trace_memory=True)
+                peak = maze.stats['peak_memory'] / 2**20
+            assert maze.check_path(path), f'{name} path is not legal!'
+            paths[name] = path
+
+            results.append({'Squares': n_cells,
+                            'Method': name,
+                            'Seconds': stats['seconds'],
+                            'Expanded': stats.get('expanded'),
+                            'Peak MB': peak,
+                            'Moves': len(path) - 1,
+                            'Cost': path_cost(maze, path)})
+            print(f'{n_cells:>10} {name:<14} {stats["seconds"]:10.3f}s '
+                  f'{stats.get("expanded", "-"):>10} expanded '
+                  f'{"-" if peak is None else f"{peak:.1f}":>8} MB '
+                  f'{len(path) - 1:>8} moves')
+
+        # the optimal methods must agree
+        assert len(paths['BFS']) == len(paths['Field']) == maze.distance[0] + 1, \
+            'BFS and distance field disagree on the least moves!'
+        assert path_cost(maze, paths['A* (manhattan)']) == path_cost(maze, paths['A* (zero)']), \
+            'A* heuristics disagree on the least squares jumped!'
+    return results
+
+
+def main():
+    max_cells = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**6
+    run(max_cells)
+
+if __name__ == '__main__':
+    main()
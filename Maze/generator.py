@@ -0,0 +1,93 @@
+# for command line arguments
+import os
+import sys
+# random grids
+import numpy as np
+
+from maze import Maze
+
+'''
+Maze generator
+
+Generates random jump mazes of any size, that are always solvable. First a
+path is planted from the start (top left) to the goal (bottom right): a
+random walk of moves right and down, each as long as the jump value set on
+its square, that ends exactly on the goal. Every other square gets a random
+jump value from 1 to max_jump, or, with probability 1 - density, a jump of 0,
+making it a dead end. So density controls how many squares can be moved on
+from, and max_jump how far the moves reach. The same seed always gives the
+same maze.
+
+Run from the command line, to write a maze file (CSV, or binary if the file
+name ends in .jmaze):
+
+>>python generator.py 1000x1000Maze.jmaze 1000 1000
+'''
+
+
+def generate(height, width, max_jump=None, density=1.0, seed=0):
+    '''
+    Generate the jump grid of a solvable maze
+    input: height, width, int, dimensions of the maze
+           max_jump, int, largest jump value (default a quarter of the larger
+                     dimension, at most 255)
+           density, float, probability of a square not being a dead end
+           seed, int, seed for the random number generator
+    return: jumps, 2D array of the jump values (0 for the goal and dead ends)
+            goal, tuple (y, x) of the goal
+    '''
+    if max_jump is None:
+        max_jump = min(255, max(1, max(height, width) // 4))
+    rng = np.random.default_rng(seed)
+    jumps = rng.integers(1, max_jump + 1, size=(height, width), dtype=np.uint8)
+    if density < 1:
+        jumps[rng.random((height, width)) >= density] = 0
+
+    # plant a path from the start to the goal
+    y, x = 0, 0
+    goal = (height - 1, width - 1)
+    while (y, x) != goal:
+        down = height - 1 - y
+        right = width - 1 - x
+        if rng.random() < down / (down + right):
+            jump = rng.integers(1, min(down, max_jump) + 1)
+            jumps[y, x] = jump
+            y += jump
+        else:
+            jump = rng.integers(1, min(right, max_jump) + 1)
+            jumps[y, x] = jump
+            x += jump
+
+    jumps[goal] = 0
+    return jumps, goal
+
+
+def generate_maze(height, width, max_jump=None, density=1.0, seed=0):
+    '''
+    Generate a solvable maze
+    input: as for generate
+    return: the Maze object
+    '''
+    maze = Maze()
+    maze.set_grid(*generate(height, width, max_jump, density, seed))
+    return maze
+
+
+def main():
+    if len(sys.argv) < 4:
+        print('usage: python generator.py <file> <height> <width> [max_jump] [density] [seed]')
+        sys.exit(1)
+    file_path = sys.argv[1]
+    height, width = int(sys.argv[2]), int(sys.argv[3])
+    max_jump = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    density = float(sys.argv[5]) if len(sys.argv) > 5 else 1.0
+    seed = int(sys.argv[6]) if len(sys.argv) > 6 else 0
+
+    maze = generate_maze(height, width, max_jump, density, seed)
+    if os.path.splitext(file_path)[1] == '.jmaze':
+        maze.save_binary(file_path)
+    else:
+        maze.save_csv(file_path)
+
+if __name__ == '__main__':
+    main()
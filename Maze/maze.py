@@ -1,16 +1,46 @@
 # to load data files
+import os
 import csv
+import struct
 # for command line arguments
 import sys
+# search statistics
+import time
+import tracemalloc
+# compact grid and adjacency arrays
+import numpy as np
 
 # import my search implementations
-from searches import depth_first, a_star
+from searches import depth_first, breadth_first, a_star, distance_field, walk_paths
+
+
+# binary maze files: magic, format version, then height, width, start (y, x)
+# and goal (y, x), followed by the uint8 jump grid, row by row
+MAGIC = b'JMAZ'
+VERSION = 1
+HEADER = struct.Struct('<4s7I')
 
 
 class Maze:
     def __init__(self):
-        self.maze = None
         self.start = (0, 0)
+
+        # jump value of each cell (0 for the goal), and the adjacency
+        # graph over flat cell indexes (y * width + x), built when first
+        # needed
+        self.jumps = None
+        self.indptr = None
+        self.indices = None
+
+        # moves to the goal and next cell for every cell, once built
+        self.distance = None
+        self.next_hop = None
+
+        # statistics of the last solve
+        self.stats = {}
+
+        # hash of the maze's content, for the solution cache
+        self.content_hash = None
         pass
 
     def __str__(self):
@@ -19,36 +49,156 @@ class Maze:
         input: none
         return: formatted string
         '''
-        assert self.maze is not None, 'Load a maze first!'
+        assert self.jumps is not None, 'Load a maze first!'
         output=[]
-        for row in self.maze:
+        for y, row in enumerate(self.jumps.tolist()):
             string = [' ']
-            for col in row:
-                string.append(col)
+            for x, col in enumerate(row):
+                string.append('G' if (y, x) == self.goal else str(col))
             string.append(' ')
             output.append(' | '.join(string))
         return '\n'.join(output)
 
     def load_maze(self, file_path):
         '''
-        Read the CSV file and load the maze from it. Get
-        width and height.
+        Load the maze from a file, either a CSV file or a binary maze file
+        (see save_binary). Get width and height.
+        input: file path
+        '''
+        with open(file_path, 'rb') as FP:
+            binary = FP.read(len(MAGIC)) == MAGIC
+        if binary:
+            self.load_binary(file_path)
+        else:
+            self.load_csv(file_path)
+
+    def load_csv(self, file_path):
+        '''
+        Read the CSV file and load the maze from it, starting at the top
+        left square.
         input: CSV file path
         '''
-        self.maze = []
         with open(file_path, 'r') as FP:
-            reader = csv.reader(FP, delimiter=',')
-            for y, row in enumerate(reader):
-                self.maze.append(row)
+            rows = FP.read().split()
+        if not rows:
+            raise ValueError('The maze file is empty!')
+        height = len(rows)
+        width = rows[0].count(',') + 1
+
+        # check for goal node, if so cache it as self.goal. Needed
+        # for A*.
+        text = ','.join(rows)
+        g = text.find('G')
+        if g == -1:
+            raise ValueError('No goal (G) in the maze file!')
+        goal = divmod(text.count(',', 0, g), width)
+
+        # jump values as a compact grid, the goal as 0
+        jumps = np.fromstring(text.replace('G', '0'), dtype=np.int64, sep=',')
+        if len(jumps) != height * width:
+            raise ValueError('Rows are not all the same length!')
+        self.set_grid(jumps.astype(np.int16).reshape(height, width), goal)
+
+    def load_binary(self, file_path):
+        '''
+        Load a binary maze file. The jump grid is memory-mapped read-only,
+        so only its header is read from the file here.
+        input: binary maze file path
+        '''
+        with open(file_path, 'rb') as FP:
+            header = FP.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError('Binary maze file is too short!')
+        magic, version, height, width, *cells = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a binary maze file!')
+        if os.path.getsize(file_path) < HEADER.size + height * width:
+            raise ValueError('Binary maze file is too short!')
+        jumps = np.memmap(file_path, dtype=np.uint8, mode='r',
+                          offset=HEADER.size, shape=(height, width))
+        self.set_grid(jumps, (cells[2], cells[3]), (cells[0], cells[1]))
+
+    def set_grid(self, jumps, goal, start=(0, 0)):
+        '''
+        Set the maze from its grid of jump values. Squares with a jump of 0
+        (other than the goal) are dead ends.
+        input: jumps, 2D array of the jump value of each square
+               goal, tuple (y, x) of the goal
+               start, tuple (y, x) of the start (default top left)
+        '''
+        self.jumps = jumps
+        self.height, self.width = jumps.shape
+        self.goal = tuple(goal)
+        self.start = tuple(start)
+        self.reset()
+
+    def save_binary(self, file_path):
+        '''
+        Save the maze as a binary maze file: the header with its dimensions,
+        start and goal, then the jump values as one byte per square.
+        input: file path
+        '''
+        assert self.jumps is not None, 'Load a maze first!'
+        if self.jumps.max() > 255:
+            raise ValueError('Jumps too large for the binary format!')
+        with open(file_path, 'wb') as FP:
+            FP.write(HEADER.pack(MAGIC, VERSION, self.height, self.width,
+                                 *self.start, *self.goal))
+            FP.write(np.ascontiguousarray(self.jumps, dtype=np.uint8).tobytes())
+
+    def save_csv(self, file_path):
+        '''
+        Save the maze as a CSV file, G marking the goal. The start is not
+        saved, as it is always the top left square in this format.
+        input: file path
+        '''
+        assert self.jumps is not None, 'Load a maze first!'
+        goal = self.goal[0] * self.width + self.goal[1]
+        cells = np.asarray(self.jumps).reshape(-1).astype(str)
+        cells[goal] = 'G'
+        with open(file_path, 'w') as FP:
+            for y in range(self.height):
+                FP.write(','.join(cells[y * self.width:(y + 1) * self.width]) + '\n')
+
+    def reset(self):
+        '''
+        Forget the graph, distance field and content hash of the previous maze
+        input: none
+        '''
+        self.indptr = None
+        self.indices = None
+        self.distance = None
+        self.next_hop = None
+        self.content_hash = None
 
-                # check for goal node, if so cache it as self.goal. Needed
-                # for A*.
-                for x in range(len(row)):
-                    if row[x] == 'G':
-                        self.goal = (y, x)
+    def build_graph(self):
+        '''
+        Build the jump graph once, in compressed sparse row (CSR) form over
+        flat cell indexes (y * width + x). The cells that can be moved to
+        from cell v are indices[indptr[v]:indptr[v + 1]], in the same order
+        as get_adjacent always gave them (left, up, right, down). The searches
+        use this, so expanding a node involves no parsing or list building.
+        input: none
+        '''
+        n_cells = self.height * self.width
+        cells = np.arange(n_cells, dtype=np.int64)
+        y, x = np.divmod(cells, self.width)
+        jump = self.jumps.reshape(-1).astype(np.int64)
+        moves = jump > 0
 
-        self.height = len(self.maze)
-        self.width = len(self.maze[0])
+        targets = np.stack([cells - jump,
+                            cells - jump * self.width,
+                            cells + jump,
+                            cells + jump * self.width], axis=1)
+        valid = np.stack([moves & (x - jump >= 0),
+                          moves & (y - jump >= 0),
+                          moves & (x + jump < self.width),
+                          moves & (y + jump < self.height)], axis=1)
+
+        index_type = np.int32 if n_cells < 2**31 else np.int64
+        self.indices = targets[valid].astype(index_type)
+        self.indptr = np.zeros(n_cells + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=self.indptr[1:])
 
     def get_adjacent(self, cell):
         '''
@@ -56,36 +206,159 @@ class Maze:
         Input: cell, tuple containing (y, x) row and column indexes
         returns: list of cells that can traversed to
         '''
+        if self.indptr is None:
+            self.build_graph()
         y, x = cell
-        jump = int(self.maze[y][x])
-        adjacent = []
-        if x - jump >= 0:
-            adjacent.append((y, x - jump))
-        if y - jump >= 0:
-            adjacent.append((y - jump, x))
-        if x + jump < self.width:
-            adjacent.append((y, x + jump))
-        if y + jump < self.height:
-            adjacent.append((y + jump, x))
-        return adjacent
-
-    def solve_maze(self, search_method, verbose):
-        '''
-        Solve the maze by method
-        input: search_method, string {'DFS', 'A*'}
+        v = y * self.width + x
+        return [divmod(int(adj), self.width) 
+                for adj in self.indices[self.indptr[v]:self.indptr[v + 1]]]
+
+    def build_distance_field(self):
+        '''
+        Precompute, with one reverse search from the goal, the least number
+        of moves to the goal from every cell and the next cell to move to.
+        After that a shortest path from any start is just a walk along the
+        next cells, see solve_maze with 'Field' and solve_many.
+        input: none
+        '''
+        assert self.jumps is not None, 'First load a maze file!'
+        if self.indptr is None:
+            self.build_graph()
+        self.distance, self.next_hop = distance_field(self)
+
+    def solve_maze(self, search_method, verbose, start=None, heuristic='manhattan',
+                   trace_memory=False, cache=None):
+        '''
+        Solve the maze by method. The statistics of the search are kept as
+        self.stats: the wall time in seconds, the nodes expanded and peak
+        frontier size (and for A* the heap pushes, stale pops and closed
+        nodes reopened), and the peak memory allocated if traced.
+        input: search_method, string {'DFS', 'BFS', 'A*', 'Field'}
+               start, tuple (y, x) of the cell to start from (optional, it
+                      then becomes the maze's start)
+               heuristic, the heuristic for A*, string {'manhattan', 'zero',
+                          'moves'} or an array of it for each flat cell index
+               trace_memory, True to trace the peak memory of the search
+                             (slows it down). A trace already started by the
+                             caller is kept, but its peak is reset.
+               cache, a SolutionCache to look the solution up in first, and
+                      keep it in if not found (optional)
         return: path found
         '''
-        assert self.maze is not None, 'First load a maze file!'
-        if search_method == 'DFS':
-            result = depth_first(self)
-        elif search_method == 'A*':
-            result = a_star(self, verbose)
-        else:
+        assert self.jumps is not None, 'First load a maze file!'
+        if start is not None:
+            self.start = tuple(start)
+        if search_method not in ('DFS', 'BFS', 'A*', 'Field'):
             raise ValueError('Invalid search method')
+
+        if cache is not None:
+            begin = time.perf_counter()
+            key = cache.key(self, search_method, heuristic)
+            result = cache.get(key)
+            if result is not None:
+                self.stats = {'method': search_method, 'cached': True,
+                              'seconds': time.perf_counter() - begin}
+                return result
+
+        # BFS works on the jump grid itself, the others on the graph
+        if search_method != 'BFS' and self.indptr is None:
+            self.build_graph()
+
+        stats = {'method': search_method}
+        if trace_memory:
+            # keep any trace a caller already started, only resetting its peak
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        begin = time.perf_counter()
+        try:
+            if search_method == 'DFS':
+                result = depth_first(self, stats=stats)
+            elif search_method == 'BFS':
+                result = breadth_first(self, stats=stats)
+            elif search_method == 'A*':
+                result = a_star(self, verbose, heuristic, stats)
+            else:
+                result = self.solve_many([self.start])[0]
+        finally:
+            stats['seconds'] = time.perf_counter() - begin
+            if trace_memory:
+                stats['peak_memory'] = tracemalloc.get_traced_memory()[1] - baseline
+                if started:
+                    tracemalloc.stop()
+        self.stats = stats
+        if cache is not None:
+            cache.put(key, result)
         return result
 
+    def solve_many(self, starts):
+        '''
+        Find a path with the least number of moves to the goal from each
+        of many start cells, by walking the distance field (built first
+        if need be).
+        input: starts, list of (y, x) tuples
+        return: list of paths found, empty if the goal can't be reached
+        '''
+        if self.distance is None:
+            self.build_distance_field()
+        starts = np.asarray(starts, dtype=np.int64).reshape(-1, 2)
+        return walk_paths(self.next_hop, self.distance,
+                          starts[:, 0] * self.width + starts[:, 1], self.width)
+
+    def check_path(self, path):
+        '''
+        Check a path is a legal way through the maze: from the start to the
+        goal, each move one the jump value of its square allows.
+        input: path, list of (y, x) tuples
+        return: True if legal
+        '''
+        if len(path) == 0 or tuple(path[0]) != self.start or tuple(path[-1]) != self.goal:
+            return False
+        return all(tuple(adj) in self.get_adjacent(tuple(cell))
+                   for cell, adj in zip(path, path[1:]))
+
+
+def load_solution(file_path):
+    '''
+    Read the expected path from a solution file
+    input: file path, one y,x row per square of the path
+    return: path, list of (y, x) tuples
+    '''
+    solution = []
+    with open(file_path, 'r') as FP:
+        reader = csv.reader(FP, delimiter=',')
+        for row in reader:
+            values = [int(x) for x in row]
+            solution.append(tuple(values))
+    return solution
+
+
+def convert_maze(file_path, binary_path=None):
+    '''
+    Convert a CSV maze file to a binary maze file
+    input: file_path, CSV file path
+           binary_path, path of the binary file (default is the CSV file
+                        path with the extension .jmaze)
+    return: path of the binary file
+    '''
+    if binary_path is None:
+        binary_path = os.path.splitext(file_path)[0] + '.jmaze'
+    maze = Maze()
+    maze.load_csv(file_path)
+    maze.save_binary(binary_path)
+    return binary_path
+
 
 def main():
+    # Convert CSV maze files to binary, if asked to
+    if len(sys.argv) > 2 and sys.argv[1] == 'convert':
+        for file_path in sys.argv[2:]:
+            print(f'{file_path} -> {convert_maze(file_path)}')
+        return
+
     # Get comman line argument if verbose mode chosen
     if len(sys.argv) > 1:
         verbose = sys.argv[1] == 'verbose'
@@ -98,12 +371,7 @@ def main():
     for maze_file, solution_file in zip(maze_files, solution_files):
 
         # fetch solution
-        solution = []
-        with open(solution_file, 'r') as FP:
-            reader = csv.reader(FP, delimiter=',')
-            for row in reader:
-                values = [int(x) for x in row]
-                solution.append(tuple(values))
+        solution = load_solution(solution_file)
 
         # implement the Maze object
         maze.load_maze(maze_file)
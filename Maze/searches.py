@@ -1,105 +1,345 @@
 # to implement priority queue for A*
 from heapq import heappop, heappush
+# per-cell search state as compact arrays
+import numpy as np
 
 
-def depth_first(maze, v=None):
+def depth_first(maze, v=None, stats=None):
     '''
-    Recursive depth first search
+    Iterative depth first search
+
+    The recursion is replaced by an explicit stack, so long paths do not hit
+    Python's recursion limit. Each cell is visited at most once, marked in a
+    bytearray indexed by the cell's flat index (y * width + x), so the search
+    is linear in the number of cells. Adjacent cells come from the maze's
+    precomputed jump graph.
+
     input: maze. the maze to be searched (as Maze object)
            v, 'verbose' (ignored here)
-    returns: the path found
+           stats, dictionary to add the counts of the search to (optional):
+                  nodes expanded and the peak depth of the stack
+    returns: the path found (empty if there is none)
     '''
-    path_found = []
+    width = maze.width
+    indptr = memoryview(maze.indptr)
+    indices = memoryview(maze.indices)
+    start = maze.start[0] * width + maze.start[1]
+    goal = maze.goal[0] * width + maze.goal[1]
+    if start == goal:
+        return [maze.start]
 
-    def recurse(node, path):
-        '''
-        Embedded function to perform recursion        
-        '''
-        nonlocal path_found
-        path.append(node)
-        y, x = node
+    expanded = peak = 1
+    visited = bytearray(maze.height * width)
+    visited[start] = 1
 
-        # goal found?
-        if maze.maze[y][x] == 'G':
-            path_found = path[:]
-            return
+    # The stack holds the current path, each node with the position in
+    # indices of the next adjacent square to try
+    path = [start]
+    positions = [indptr[start]]
+    while len(path) > 0:
+        node = path[-1]
+        position = positions[-1]
+        if position == indptr[node + 1]:
+            # dead end, backtrack
+            path.pop()
+            positions.pop()
+            continue
 
-        # Get next squares to visit
-        adjacent = maze.get_adjacent(node)
-        for adj in adjacent:
-            if adj in path:
-                continue
-            recurse(adj, path)
-            if len(path) > 0:
-                path.pop()
+        adj = indices[position]
+        positions[-1] = position + 1
+        if visited[adj]:
+            continue
+        visited[adj] = 1
+        path.append(adj)
+        positions.append(indptr[adj])
+        expanded += 1
+        if len(path) > peak:
+            peak = len(path)
 
-    # run the embedded function
-    recurse(maze.start, [])
-    return path_found
+        # goal found?
+        if adj == goal:
+            break
+    if stats is not None:
+        stats.update({'expanded': expanded, 'peak_frontier': peak})
+    return [divmod(node, width) for node in path]
 
-def retrace_path(parents, end):
+def retrace_path(parents, end, width):
     '''
     Helper function for A*. Trace back the path to the
     goal.
-    input: parents, dictionary mapping nodes to parents.
-           None if start node.
-           end: the goal node as tuple (y, x)
-    return: path, list of nodes
+    input: parents, array mapping flat node indexes to parents.
+           -1 if start node.
+           end: the goal node as flat index
+           width: width of the maze
+    return: path, list of nodes as tuples (y, x)
     '''
     path = []
-    path.append(end)
-    while parents[end] is not None:
-        path.append(parents[end])
+    path.append(divmod(end, width))
+    while parents[end] != -1:
         end = parents[end]
+        path.append(divmod(end, width))
     path.reverse()
     return path
 
-def a_star(maze, verbose=False):
+def manhattan(maze):
+    '''
+    Manhattan distance heuristic for A*. A move of jump j costs j and
+    changes the Manhattan distance to the goal by at most j, so this never
+    overestimates.
+    input: maze, the Maze object
+    return: array of the heuristic for each flat cell index
+    '''
+    y, x = np.divmod(np.arange(maze.height * maze.width, dtype=np.int64), maze.width)
+    return np.abs(y - maze.goal[0]) + np.abs(x - maze.goal[1])
+
+def zero(maze):
+    '''
+    Zero heuristic for A*, which makes it Dijkstra's algorithm
+    input: maze, the Maze object
+    return: array of the heuristic for each flat cell index
+    '''
+    return np.zeros(maze.height * maze.width, dtype=np.int64)
+
+def moves(maze):
+    '''
+    Heuristic for A* from the maze's distance field: the least number of
+    moves to the goal. Every move costs at least 1, so this never
+    overestimates either, and is often much closer than Manhattan distance.
+    Cells the goal can not be reached from are given 0.
+    input: maze, the Maze object
+    return: array of the heuristic for each flat cell index
+    '''
+    if maze.distance is None:
+        maze.build_distance_field()
+    return np.maximum(maze.distance, 0).astype(np.int64)
+
+HEURISTICS = {'manhattan': manhattan, 'zero': zero, 'moves': moves}
+
+def a_star(maze, verbose=False, heuristic='manhattan', stats=None):
     '''
     A* search
     input: maze, the Maze object
            v, verbose. True to print each expanded node with f_score.
+           heuristic, string {'manhattan', 'zero', 'moves'}, or a precomputed
+                      array of the heuristic for each flat cell index
+           stats, dictionary to add the counts of the search to (optional):
+                  nodes expanded, heap pushes, stale pops (entries skipped
+                  as a shorter path was since found), closed nodes reopened
+                  and the peak size of the frontier
     '''
-    # keep track of each node's predecessor
-    parents = {maze.start: None}
+    width = maze.width
+    indptr = memoryview(maze.indptr)
+    indices = memoryview(maze.indices)
+    jumps = memoryview(maze.jumps.reshape(-1))
+    start = maze.start[0] * width + maze.start[1]
+    goal = maze.goal[0] * width + maze.goal[1]
+    if isinstance(heuristic, str):
+        heuristic = HEURISTICS[heuristic](maze)
+    h_scores = memoryview(np.ascontiguousarray(heuristic, dtype=np.int64))
+
+    # keep track of each node's predecessor, -1 for none
+    parents = np.full(maze.height * width, -1, dtype=np.int64)
 
-    # the visited nodes are as a dictionary instead of a set so
+    # the visited nodes are as an array instead of a set so
     # each seen node can be associated with its distance from the
-    # start node
-    visited = {maze.start: 0}
+    # start node (-1 if not yet seen)
+    distances = np.full(maze.height * width, -1, dtype=np.int64)
+    visited = memoryview(distances)
+    visited[start] = 0
 
-    # Each node is represented as a tuple, (f_score, (y, x)). This way
-    # the priority queue keeps them in sorted order
-    que = [(0, maze.start)]
+    # nodes already expanded with their shortest distance
+    closed = bytearray(maze.height * width)
+
+    expanded = pushes = stale = reopened = 0
+    peak = 1
+
+    # Each node is represented as a tuple, (f_score, flat index, g_score).
+    # This way the priority queue keeps them in sorted order, and entries
+    # left behind when a shorter path was found can be told apart
+    path = []
+    que = [(0, start, 0)]
     while len(que) > 0:
-        node = heappop(que)
-        y, x = node[1]
+        _, node, g = heappop(que)
+
+        # skip stale entries
+        if g != visited[node]:
+            stale += 1
+            continue
+        closed[node] = 1
+        expanded += 1
 
         # goal found?
-        if maze.maze[y][x] == 'G':
-            path = retrace_path(parents, node[1])
+        if node == goal:
+            path = retrace_path(memoryview(parents), node, width)
             break
 
-        # Get next squares to visit
-        adjacent = maze.get_adjacent(node[1])
-        for adj in adjacent:
+        # get summed actual distance to the next nodes. Distance between squares
+        # is 1, so distance is the number of squares jumped to.
+        g = visited[node] + jumps[node]
 
-            # get summed actual distance to the next node. Distance between squares
-            # is 1, so distance is the number of squares jumped to.
-            g = visited[node[1]] + int(maze.maze[y][x])
+        # Get next squares to visit
+        for position in range(indptr[node], indptr[node + 1]):
+            adj = indices[position]
 
             # if we have not yet visited this node, or we now have a shorter
             # path to it, add it to the queue
-            g_adj = visited.get(adj)
-            if g_adj is None or g < g_adj:
+            g_adj = visited[adj]
+            if g_adj == -1 or g < g_adj:
                 if verbose:
-                    print(f'Node expanded: {adj} cost: {g}')
-                parents[adj] = node[1]
+                    print(f'Node expanded: {divmod(adj, width)} cost: {g}')
+                if closed[adj]:
+                    closed[adj] = 0
+                    reopened += 1
+                parents[adj] = node
                 visited[adj] = g
 
-                # Manhattan distance as heurisitic
-                h = abs(adj[0] - maze.goal[0]) + abs(adj[1] - maze.goal[1])
-                f = h + g
+                f = h_scores[adj] + g
+                heappush(que, (f, adj, g))
+                pushes += 1
+        if len(que) > peak:
+            peak = len(que)
 
-                heappush(que, (f, adj))
+    if stats is not None:
+        stats.update({'expanded': expanded,
+                      'pushes': pushes,
+                      'stale_pops': stale,
+                      'reopened': reopened,
+                      'peak_frontier': peak})
     return path
+
+def breadth_first(maze, v=None, stats=None):
+    '''
+    Level-synchronous breadth first search
+
+    The whole frontier is expanded at once with array operations on the
+    jump grid: each frontier cell is shifted by its jump value in each of
+    the four directions, and the cells not yet reached become the next
+    frontier. As every move counts the same, the path found has the least
+    number of moves.
+
+    input: maze. the maze to be searched (as Maze object)
+           v, 'verbose' (ignored here)
+           stats, dictionary to add the counts of the search to (optional):
+                  nodes expanded and the peak size of the frontier
+    returns: the path found (empty if there is none)
+    '''
+    width = maze.width
+    height = maze.height
+    jumps = maze.jumps.reshape(-1)
+    start = maze.start[0] * width + maze.start[1]
+    goal = maze.goal[0] * width + maze.goal[1]
+
+    # keep track of each node's predecessor, -1 for none, and the nodes
+    # reached so far
+    parents = np.full(height * width, -1, dtype=np.int64)
+    reached = np.zeros(height * width, dtype=bool)
+    reached[start] = True
+    frontier = np.array([start], dtype=np.int64)
+    expanded = peak = 0
+    while len(frontier) > 0 and not reached[goal]:
+        expanded += len(frontier)
+        peak = max(peak, len(frontier))
+        y, x = np.divmod(frontier, width)
+        jump = jumps[frontier].astype(np.int64)
+        moves = jump > 0
+
+        # targets of each frontier cell, left, up, right and down
+        targets = np.concatenate([frontier - jump,
+                                  frontier - jump * width,
+                                  frontier + jump,
+                                  frontier + jump * width])
+        valid = np.concatenate([moves & (x - jump >= 0),
+                                moves & (y - jump >= 0),
+                                moves & (x + jump < width),
+                                moves & (y + jump < height)])
+        sources = np.tile(frontier, 4)[valid]
+        targets = targets[valid]
+
+        # keep the ones not yet reached, each with the first parent found
+        unseen = ~reached[targets]
+        frontier, first = np.unique(targets[unseen], return_index=True)
+        reached[frontier] = True
+        parents[frontier] = sources[unseen][first]
+
+    if stats is not None:
+        stats.update({'expanded': expanded, 'peak_frontier': peak})
+    if not reached[goal]:
+        return []
+    return retrace_path(memoryview(parents), goal, width)
+
+def reverse_graph(maze):
+    '''
+    Helper function for the distance field. Build the reversed jump
+    graph, in the same CSR form as the maze's graph, so the cells that
+    can move to cell v are rev_indices[rev_indptr[v]:rev_indptr[v + 1]].
+    input: maze, the Maze object
+    return: rev_indptr, rev_indices arrays
+    '''
+    n_cells = maze.height * maze.width
+    sources = np.repeat(np.arange(n_cells, dtype=maze.indices.dtype),
+                        np.diff(maze.indptr))
+    order = np.argsort(maze.indices, kind='stable')
+    rev_indices = sources[order]
+    rev_indptr = np.zeros(n_cells + 1, dtype=np.int64)
+    np.cumsum(np.bincount(maze.indices, minlength=n_cells), out=rev_indptr[1:])
+    return rev_indptr, rev_indices
+
+def distance_field(maze):
+    '''
+    Reverse breadth first search from the goal, over the reversed jump
+    graph. Each level of the search is expanded at once with array
+    operations. The result gives, for every cell, the least number of
+    moves to the goal and the next cell to move to on such a path.
+    input: maze, the Maze object
+    return: distance, array of the moves to the goal for each flat cell
+            index (-1 if the goal can not be reached)
+            next_hop, array of the next flat cell index on the path (-1 for
+            the goal and unreachable cells)
+    '''
+    n_cells = maze.height * maze.width
+    rev_indptr, rev_indices = reverse_graph(maze)
+    goal = maze.goal[0] * maze.width + maze.goal[1]
+
+    distance = np.full(n_cells, -1, dtype=np.int32)
+    next_hop = np.full(n_cells, -1, dtype=maze.indices.dtype)
+    distance[goal] = 0
+    frontier = np.array([goal], dtype=np.int64)
+    level = 0
+    while len(frontier) > 0:
+        level += 1
+
+        # gather all the cells that can move to a cell in the frontier
+        starts = rev_indptr[frontier]
+        counts = rev_indptr[frontier + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        sources = rev_indices[np.repeat(starts, counts) + offsets]
+        targets = np.repeat(frontier, counts)
+
+        # keep the ones not yet reached, each with the first target found
+        unseen = distance[sources] == -1
+        sources, first = np.unique(sources[unseen], return_index=True)
+        distance[sources] = level
+        next_hop[sources] = targets[unseen][first]
+        frontier = sources.astype(np.int64)
+    return distance, next_hop
+
+def walk_paths(next_hop, distance, starts, width):
+    '''
+    Follow the next hops of a distance field from many start cells at
+    once, every path taking its next step together.
+    input: next_hop, distance, the arrays from distance_field
+           starts, array of flat cell indexes to start from
+           width, width of the maze
+    return: list of paths, each a list of nodes as tuples (y, x) (empty
+            if the goal can not be reached from the start)
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = distance[starts]
+    steps = np.empty((len(starts), max(lengths.max(initial=0), 0) + 1), dtype=np.int64)
+    steps[:, 0] = starts
+    for i in range(1, steps.shape[1]):
+        steps[:, i] = next_hop[steps[:, i - 1]]
+
+    ys, xs = np.divmod(steps, width)
+    return [list(zip(ys[i, :length + 1].tolist(), xs[i, :length + 1].tolist()))
+            if length >= 0 else [] for i, length in enumerate(lengths.tolist())]
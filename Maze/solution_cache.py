@@ -0,0 +1,191 @@
+# keys and disk files
+import os
+import time
+import hashlib
+from collections import OrderedDict
+# paths stored as arrays
+import numpy as np
+
+'''
+Solution cache
+
+Solving the same maze again gives the same path, so solutions can be kept
+and looked up instead. The key is a SHA-256 hash of the maze's content (its
+dimensions and jump grid), its start and goal, and the search method (and
+A* heuristic). The maze's content hash is computed once per loaded maze, so
+a repeated solve costs only a hash of those few values and a lookup.
+
+Solutions are kept in an in-process LRU (least recently used) tier, and
+optionally on disk, in a directory of .npy files bounded in total size: when
+it grows past the limit, the least recently used files are removed. The
+cache counts its hits and misses, to report its hit rate.
+
+>>> from solution_cache import SolutionCache
+>>> cache = SolutionCache(directory='solutions')
+>>> result = maze.solve_maze('A*', False, cache=cache)
+'''
+
+
+def content_hash(maze):
+    '''
+    Hash of a maze's content: its dimensions and jump values (the same for
+    a maze loaded from CSV or from a binary file)
+    input: maze, the Maze object
+    return: hex digest of the hash
+    '''
+    digest = hashlib.sha256()
+    digest.update(np.array([maze.height, maze.width], dtype='<i8').tobytes())
+    digest.update(np.ascontiguousarray(maze.jumps, dtype='<i2').tobytes())
+    return digest.hexdigest()
+
+
+class SolutionCache:
+    def __init__(self, max_entries=1024, directory=None, max_bytes=2**28):
+        '''
+        input: max_entries, int, most solutions kept in memory
+               directory, path of the disk tier (optional, memory only if
+                          not given)
+               max_bytes, int, most bytes of solutions kept on disk
+        '''
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for entry in os.scandir(directory):
+                if entry.name.endswith('.tmp.npy'):
+                    # left by a process which stopped while writing
+                    if entry.stat().st_mtime < time.time() - 3600:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+                elif entry.name.endswith('.npy'):
+                    self.disk_bytes += entry.stat().st_size
+
+    def key(self, maze, method, heuristic='manhattan'):
+        '''
+        The key of a solve
+        input: maze, the Maze object
+               method, string, the search method
+               heuristic, the heuristic for A*, string or array
+        return: hex digest of the key
+        '''
+        if maze.content_hash is None:
+            maze.content_hash = content_hash(maze)
+        if method != 'A*':
+            heuristic = ''
+        elif not isinstance(heuristic, str):
+            heuristic = hashlib.sha256(np.ascontiguousarray(heuristic).tobytes()).hexdigest()
+        values = [maze.content_hash, *maze.start, *maze.goal, method, heuristic]
+        return hashlib.sha256(','.join(str(value) for value in values).encode()).hexdigest()
+
+    def get(self, key):
+        '''
+        Look up a solution, in memory then on disk
+        input: key, as from SolutionCache.key
+        return: the path, or None if not cached
+        '''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(self.entries[key])
+
+        if self.directory is not None:
+            file_path = self.__file_path(key)
+            try:
+                path = np.load(file_path)
+            except (OSError, ValueError):
+                path = None
+            if path is not None:
+                # mark as recently used
+                os.utime(file_path)
+                path = tuple(map(tuple, path.tolist()))
+                self.__remember(key, path)
+                self.hits += 1
+                self.disk_hits += 1
+                return list(path)
+
+        self.misses += 1
+        return None
+
+    def put(self, key, path):
+        '''
+        Keep a solution
+        input: key, as from SolutionCache.key
+               path, list of (y, x) tuples
+        '''
+        path = tuple(map(tuple, path))
+        self.__remember(key, path)
+        if self.directory is None:
+            return
+
+        # write to a temporary file first, so a partial file is never read
+        # (named per process, so processes sharing the directory do not clash)
+        file_path = self.__file_path(key)
+        temp_path = file_path + f'.{os.getpid()}.tmp.npy'
+        np.save(temp_path, np.array(path, dtype=np.int64).reshape(-1, 2))
+        if os.path.exists(file_path):
+            self.disk_bytes -= os.path.getsize(file_path)
+        self.disk_bytes += os.path.getsize(temp_path)
+        os.replace(temp_path, file_path)
+        if self.disk_bytes > self.max_bytes:
+            self.__evict()
+
+    @property
+    def hit_rate(self):
+        '''
+        Fraction of the lookups found in the cache
+        '''
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def report(self):
+        '''
+        Statistics of the cache
+        input: none
+        return: dictionary of the hits, disk hits, misses, hit rate, the
+                number of solutions in memory and the bytes on disk
+        '''
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+                'entries': len(self.entries),
+                'disk_bytes': self.disk_bytes}
+
+    def __remember(self, key, path):
+        '''
+        Keep a solution in memory, dropping the least recently used if full
+        '''
+        self.entries[key] = path
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __file_path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def __evict(self):
+        '''
+        Remove the least recently used files on disk until within max_bytes
+        (down to three quarters of it, so eviction is not run on every put)
+        '''
+        files = sorted((entry for entry in os.scandir(self.directory)
+                        if entry.name.endswith('.npy') and not entry.name.endswith('.tmp.npy')),
+                       key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in files:
+            if self.disk_bytes <= self.max_bytes * 3 // 4:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
@@ -1,12 +1,14 @@
+import os
 import numpy as np
-from sklearn.preprocessing import RobustScaler
+from scipy.sparse import csr_matrix
 
-import nltk
-from nltk.corpus import stopwords
 import gensim
 import gensim.downloader
 from gensim.models import TfidfModel
 from gensim.corpora import Dictionary
+from gensim.models import KeyedVectors
+
+from tokenizer import tokenize_docs
 
 '''
 Document2GLOVE class
@@ -27,33 +29,68 @@ The basic path taken, depending on if the option to tf-if filter:
 documents --> tokenize --> vectorize --> document vectors
                        |
                        |--> tf_idf filter --> vectorize --> document vectors
+
+The GLOVE model is only loaded when first needed, by transform. The first
+time, it is downloaded and parsed by Gensim, then saved as KeyedVectors with
+the vectors as a separate .npy file. After that it is loaded from there,
+memory-mapping the vectors read-only, which takes well under a second, and
+several processes using the model share one copy of the vectors in memory.
 '''
+def robust_scale(vectors):
+    '''
+    Scale each row by its own median and interquartile range, as fitting
+    scikit-learn's RobustScaler to each row (as a column) would, but for all
+    the rows at once. A row with no spread (such as all zeros) is only
+    centered.
+
+    Input: vectors, 2D array, one vector per row
+    Output: array of the scaled vectors
+    '''
+    center = np.median(vectors, axis=1, keepdims=True)
+    q_min, q_max = np.percentile(vectors, [25, 75], axis=1, keepdims=True)
+    scale = q_max - q_min
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+    return (vectors - center) / scale
+
 class Document2GLOVE:
-    def __init__(self, glove_model):
+    def __init__(self, glove_model, cache_dir=None, n_jobs=None, token_cache=None):
         '''
         Constructor
 
         Input: glove_model, the specific Gensim GLOVE model as a
                string
+               cache_dir, directory to keep the memory-mappable copy of the
+               model in (default is the Gensim data directory)
+               n_jobs, int, number of processes to tokenize with (default is
+               all the cores)
+               token_cache, directory to cache the tokens of each document
+               in (optional)
         '''
-        self.GloveModel = gensim.downloader.load(glove_model)
-
-    def __tokenize_doc(self, document):
+        self.glove_model = glove_model
+        self.n_jobs = n_jobs
+        self.token_cache = token_cache
+        if cache_dir is None:
+            cache_dir = os.path.join(gensim.downloader.BASE_DIR, 'mmap')
+        self.cache_dir = cache_dir
+        self.GloveModel = None
+
+    def __load_glove(self):
         '''
-        Tokenize a single document, filtering out also stopwords
-
-        Input: document, the untokenized text
-        Output: list of tokens
+        Load the GLOVE model, memory-mapped from the cache, converting it
+        into the cache first if not already there
         '''
-        tokens = nltk.tokenize.word_tokenize(document)
-        tags = nltk.pos_tag(tokens)
-        filtered_tokens = set()
-        for tag in tags:
-            if tag[0] in stopwords.words('english'):
-                continue
-            if tag[1] not in ['JJ', 'JJR', 'JJS']:
-                filtered_tokens.add(tag[0])
-        return filtered_tokens
+        cache_path = os.path.join(self.cache_dir, self.glove_model + '.kv')
+        if not os.path.exists(cache_path):
+            model = gensim.downloader.load(self.glove_model)
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # save under a temporary name, then rename the vectors before the
+            # model, so a partly written cache is never loaded
+            temp_path = cache_path + '.tmp'
+            model.save(temp_path, separately=['vectors'])
+            os.replace(temp_path + '.vectors.npy', cache_path + '.vectors.npy')
+            os.replace(temp_path, cache_path)
+        self.GloveModel = KeyedVectors.load(cache_path, mmap='r')
 
     def __tf_idf(self, documents, max_words=None):
         '''
@@ -77,28 +114,34 @@ class Document2GLOVE:
             filtered_docs.append(filtered_doc)
         return filtered_docs
 
-    def __vectorize_doc(self, filtered_tokens):
+    def __vectorize_docs(self, doc_tokens):
         '''
-        Vectorize a single document, as tokens
-
-        Input: filetered_tokens, a tokenized and filtered document
-        Output: document vector
+        Vectorize all the documents, as tokens, at once. Each token is mapped
+        to its row in the GLOVE vectors in one pass over the documents, as a
+        sparse matrix of counts (documents by words), so the document vectors
+        (the sums of their word vectors) are one sparse matrix product. Only
+        the GLOVE vectors of words actually used are read.
+
+        Input: doc_tokens, the tokenized and filtered documents
+        Output: array of document vectors, one row per document
         '''
-        doc_vector = np.zeros(50)
-        for Token in list(filtered_tokens):
-            try:
-                WordVectors = self.GloveModel[Token.lower()]
-                doc_vector += np.array(WordVectors)
-            except KeyError:
-                continue
-
-        # scale the vector
-        scaler = RobustScaler()
-        doc_vector = doc_vector.reshape(-1, 1)
-        doc_vector = scaler.fit_transform(doc_vector)
-        doc_vector = doc_vector.squeeze()
-
-        return doc_vector
+        key_to_index = self.GloveModel.key_to_index
+        rows = []
+        columns = []
+        for row, tokens in enumerate(doc_tokens):
+            for token in tokens:
+                column = key_to_index.get(token.lower())
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+
+        words, columns = np.unique(np.array(columns, dtype=np.int64), return_inverse=True)
+        counts = csr_matrix((np.ones(len(rows)), (rows, columns)),
+                            shape=(len(doc_tokens), len(words)))
+        word_vectors = np.asarray(self.GloveModel.vectors[words], dtype=np.float64)
+        doc_vectors = counts @ word_vectors.reshape(len(words), self.GloveModel.vector_size)
+
+        return robust_scale(np.asarray(doc_vectors))
 
     def transform(self, documents, tfidf=False, max_words=None):
         '''
@@ -110,10 +153,13 @@ class Document2GLOVE:
                           if tfidf == True.
         Output: document vectors
         '''
-        doc_tokens = [self.__tokenize_doc(doc) for doc in documents]
+        if self.GloveModel is None:
+            self.__load_glove()
+        doc_tokens = tokenize_docs(documents, n_jobs=self.n_jobs,
+                                   cache_dir=self.token_cache)
         if tfidf:
             doc_tokens = self.__tf_idf(doc_tokens, max_words=max_words)
-        doc_vects = [self.__vectorize_doc(tokens) for tokens in doc_tokens]
+        doc_vects = self.__vectorize_docs(doc_tokens)
         return doc_vects
 
     
\ No newline at end of file
@@ -1,6 +1,9 @@
 import json
+import time
 import requests
 import re
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote as url_encode
 import numpy as np
 from bs4 import BeautifulSoup
@@ -15,18 +18,70 @@ Each document is filtered of punctuation, special characters, footnotes
 (numbers within square brackets such as '[12]'), and then stored. Also
 the titles and URLs are recorded in a dictionary, with the keys the indexes
 of the individual texts in the "tank" of documents.
+
+The documents are fetched concurrently by a pool of threads, sharing one
+session so connections are kept alive and reused. While some threads wait
+on the network, others parse the pages they have already received. Failed
+requests (connection errors, timeouts, or the server being busy) are
+retried, waiting longer after each attempt. The base URL can be changed,
+for example to test against a local server.
 '''
+
+# HTTP status codes worth retrying a request on
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
 class DocumentStore:
-    def __init__(self):
-        self.base_url = 'https://en.wikipedia.org/'
+    def __init__(self, base_url='https://en.wikipedia.org/', concurrency=8,
+                 retries=3, backoff=0.5, timeout=30):
+        '''
+        Constructor
+
+        Input: base_url, string, URL of the Wikipedia site (ending in /)
+               concurrency, int, most documents fetched at once
+               retries, int, times a failed request is retried
+               backoff, float, seconds to wait before the first retry,
+                        doubling for each retry after
+               timeout, float, seconds to wait for a response
+        '''
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
         self.count = 0
 
+        # one session for all the requests, with a connection for each
+        # thread kept alive
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
         # dictionary of titles and URLS, by index
         self.documents = {}
 
         # 'tank' of documents
         self.texts = []
         
+    def __request(self, url):
+        '''
+        GET a URL, retrying with backoff on failure
+
+        Input: url, string
+        Output: the response
+        '''
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS or last_attempt:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
     def __get_titles(self):
         '''
         Get random wikipedia article titles using Wikipedia
@@ -39,7 +94,7 @@ class DocumentStore:
         # query the Wikipedia API for random articles
         query = 'w/api.php?action=query&list=random&format=json&rnnamespace=0'
         url = self.base_url + query + f'&rnlimit={self.count}'
-        req = requests.get(url)
+        req = self.__request(url)
 
         # translate into json object and extract titles
         info = json.loads(req.text)
@@ -57,7 +112,7 @@ class DocumentStore:
         '''
         # URL encode the title and request page
         url = self.base_url + f'wiki/{url_encode(title)}'
-        page = requests.get(url)
+        page = self.__request(url)
 
         # load HTML page into BeautifulSoup and extract all content
         # in <p> tags. This seems to give us the bulk of the contents.
@@ -86,7 +141,33 @@ class DocumentStore:
         self.count = count
         titles = self.__get_titles()
 
-        for index, title in enumerate(titles):
-            text, url = self.__get_document(title)
+        # fetch and parse the documents concurrently, keeping their order
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pages = list(pool.map(self.__get_document, titles))
+
+        for index, (title, (text, url)) in enumerate(zip(titles, pages)):
             self.documents[index] = {'title': title, 'url': url}
             self.texts.append(text)
+
+    def save(self, file_path):
+        '''
+        Save the titles and URLs of the documents, as JSON
+
+        Input: file_path, path of the file
+        '''
+        with open(file_path, 'w') as FP:
+            json.dump(self.documents, FP)
+
+    def load(self, file_path):
+        '''
+        Load the titles and URLs of documents saved with save (the texts
+        themselves are not saved)
+
+        Input: file_path, path of the file
+        '''
+        with open(file_path, 'r') as FP:
+            documents = json.load(FP)
+
+        # JSON keys are strings, the indexes are ints
+        self.documents = {int(index): document for index, document in documents.items()}
+        self.count = len(self.documents)
@@ -1,4 +1,9 @@
+import os
 import re
+import json
+import time
+import numpy as np
+from sklearn.cluster import KMeans
 from sklearn.neighbors import NearestNeighbors
 
 from doc2glove import Document2GLOVE
@@ -7,19 +12,211 @@ from doc2glove import Document2GLOVE
 The Model class essentially wraps the scikit-learn Nearest Neighbor
 model. This implements a consistent pipeline for both training and
 inference on a query.
+
+A fitted model can be saved as an index directory, and loaded again
+without refitting: the document vectors (vectors.npy, memory-mapped on
+loading) and the settings it was built with (settings.json, written last
+so a partly written index is never loaded).
+
+Nearest Neighbors is exact, comparing the query with every document. For
+large corpora there is also an approximate index (IVF, inverted file): the
+normalized document vectors are clustered with k-means into n_lists lists,
+and a query is only compared with the documents in the n_probe lists whose
+centroids are closest to it. More probes find more of the true nearest
+documents (recall) at the cost of speed. recall_at_k measures the recall and
+speed of an approximate index against the exact one.
 '''
+
+# files of a saved index
+VECTORS_FILE = 'vectors.npy'
+SETTINGS_FILE = 'settings.json'
+IVF_FILES = ['centroids', 'offsets', 'ids', 'ivf_vectors']
+
+
+def normalize(vectors):
+    '''
+    Scale vectors to unit length, so their dot products are their cosine
+    similarities (zero vectors are left as they are)
+
+    Input: vectors, 2D array, one vector per row
+    Output: array of the normalized vectors
+    '''
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class IVFIndex:
+    def __init__(self, n_neighbors, n_lists=None, n_probe=8, max_train=None, seed=0):
+        '''
+        Constructor, with the same interface as NearestNeighbors (fit and
+        kneighbors, with cosine distances)
+
+        Inputs: n_neighbors, int, number of matches to return
+                n_lists, int, number of lists (k-means clusters), default is
+                         the square root of the number of documents
+                n_probe, int, number of lists searched per query
+                max_train, int, most documents k-means is trained on (default
+                           256 per list)
+                seed, int, seed for k-means
+        '''
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.max_train = max_train
+        self.seed = seed
+
+        # centroids of the lists, and the documents of list i, as their ids
+        # and normalized vectors, in rows offsets[i] to offsets[i + 1]
+        self.centroids = None
+        self.offsets = None
+        self.ids = None
+        self.ivf_vectors = None
+
+    def fit(self, vectors):
+        '''
+        Build the index
+
+        Input: vectors, 2D array of the document vectors, one per row
+        '''
+        vectors = np.asarray(vectors)
+        n_documents = len(vectors)
+        n_lists = self.n_lists or int(np.sqrt(n_documents))
+        n_lists = max(1, min(n_lists, n_documents))
+        max_train = self.max_train or 256 * n_lists
+
+        # train k-means on a sample of the normalized vectors
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.permutation(n_documents)[:max_train])
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.seed)
+        kmeans.fit(normalize(np.asarray(vectors[sample], dtype=np.float64)))
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+        # assign every document to its closest centroid, a block at a time
+        lists = np.empty(n_documents, dtype=np.int64)
+        normalized = np.empty(vectors.shape, dtype=np.float32)
+        for start in range(0, n_documents, 65536):
+            block = normalize(np.asarray(vectors[start:start + 65536], dtype=np.float64))
+            normalized[start:start + 65536] = block
+            lists[start:start + 65536] = np.argmax(block @ self.centroids.T, axis=1)
+
+        # keep the documents grouped by list
+        self.ids = np.argsort(lists, kind='stable')
+        self.ivf_vectors = normalized[self.ids]
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=n_lists), out=self.offsets[1:])
+        return self
+
+    def kneighbors(self, queries, n_neighbors=None):
+        '''
+        Find the (approximately) nearest documents to each query
+
+        Input: queries, 2D array of the query vectors, one per row
+               n_neighbors, int, number of matches (default as constructed)
+        Output: cosine distances and indexes of the matches, as arrays with
+                a row per query, closest first
+        '''
+        n_neighbors = min(n_neighbors or self.n_neighbors, len(self.ids))
+        queries = normalize(np.asarray(queries, dtype=np.float64)).astype(np.float32)
+        sizes = np.diff(self.offsets)
+
+        distances = np.empty((len(queries), n_neighbors))
+        indexes = np.empty((len(queries), n_neighbors), dtype=np.int64)
+        for row, query in enumerate(queries):
+            # probe the closest lists, more if they hold too few documents
+            order = np.argsort(-(self.centroids @ query))
+            enough = np.searchsorted(np.cumsum(sizes[order]), n_neighbors) + 1
+            probes = order[:max(self.n_probe, enough)]
+            positions = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1])
+                                        for i in probes])
+
+            similarity = self.ivf_vectors[positions] @ query
+            best = np.argpartition(-similarity, n_neighbors - 1)[:n_neighbors]
+            best = best[np.argsort(-similarity[best], kind='stable')]
+            distances[row] = 1 - similarity[best]
+            indexes[row] = self.ids[positions[best]]
+        return distances, indexes
+
+    def save(self, directory):
+        '''
+        Save the index, as .npy files in the directory
+
+        Input: directory, path of the index directory
+        '''
+        for name in IVF_FILES:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+
+    def load(self, directory):
+        '''
+        Load an index saved with save, memory-mapping its arrays
+
+        Input: directory, path of the index directory
+        '''
+        for name in IVF_FILES:
+            setattr(self, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        return self
+
+
+def recall_at_k(index, vectors, queries, k=10):
+    '''
+    Compare an approximate index with the exact Nearest Neighbors: the
+    fraction of the true k nearest documents it finds, and the time taken
+    by each.
+
+    Input: index, a fitted approximate index (such as IVFIndex)
+           vectors, the document vectors the index was fitted on
+           queries, 2D array of query vectors, one per row
+           k, int, number of nearest documents
+    Output: dictionary of the recall and the seconds each index took
+    '''
+    exact = NearestNeighbors(n_neighbors=k, metric='cosine').fit(vectors)
+    start = time.perf_counter()
+    true_indexes = exact.kneighbors(queries)[1]
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexes = index.kneighbors(queries, n_neighbors=k)[1]
+    seconds = time.perf_counter() - start
+
+    found = sum(len(np.intersect1d(row, true_row)) for row, true_row in zip(indexes, true_indexes))
+    return {'recall': found / true_indexes.size,
+            'exact_seconds': exact_seconds,
+            'seconds': seconds}
+
+
 class Model:
-    def __init__(self, n_nearest, glove_model):
+    def __init__(self, n_nearest, glove_model, token_cache=None, index='exact',
+                 n_lists=None, n_probe=8):
         '''
         Constructor
 
         Inputs: n_nearest, int, number of matches to return
                 glove_model, string, the Gensim GLOVE model to use
+                token_cache, directory to cache the tokens of each document
+                in (optional)
+                index, string {'exact', 'ivf'}, the nearest neighbor index
+                n_lists, n_probe, int, the lists and lists probed of the
+                ivf index (see IVFIndex)
         '''
-        self.vectorize_doc = Document2GLOVE(glove_model)
-        self.KNN = NearestNeighbors(n_neighbors=n_nearest,
-                                    metric='cosine',
-                                    n_jobs=-1)
+        self.n_nearest = n_nearest
+        self.glove_model = glove_model
+        self.index = index
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.vectorize_doc = Document2GLOVE(glove_model, token_cache=token_cache)
+        if index == 'exact':
+            self.KNN = NearestNeighbors(n_neighbors=n_nearest,
+                                        metric='cosine',
+                                        n_jobs=-1)
+        elif index == 'ivf':
+            self.KNN = IVFIndex(n_nearest, n_lists=n_lists, n_probe=n_probe)
+        else:
+            raise ValueError('Invalid index')
+
+        # document vectors and the settings they were built with
+        self.vectors = None
+        self.tfidf = False
+        self.max_words = None
 
     def fit(self, documents, tfidf=False, max_words=None):
         '''
@@ -33,7 +230,10 @@ class Model:
         data = self.vectorize_doc.transform(documents, 
                                             tfidf=tfidf, 
                                             max_words=max_words)
-        self.KNN.fit(data)
+        self.vectors = np.asarray(data, dtype=np.float64)
+        self.tfidf = tfidf
+        self.max_words = max_words
+        self.KNN.fit(self.vectors)
         return self.KNN
 
     def infer(self, query):
@@ -49,3 +249,65 @@ class Model:
         data = self.vectorize_doc.transform([query])
         results = self.KNN.kneighbors(data)
         return results
+
+    def save(self, directory):
+        '''
+        Save the fitted model as an index directory
+
+        Input: directory, path of the index directory
+        '''
+        assert self.vectors is not None, 'Fit the model first!'
+        os.makedirs(directory, exist_ok=True)
+
+        # invalidate any old index before overwriting its vectors
+        settings_path = os.path.join(directory, SETTINGS_FILE)
+        if os.path.exists(settings_path):
+            os.remove(settings_path)
+
+        np.save(os.path.join(directory, VECTORS_FILE), self.vectors)
+        if self.index == 'ivf':
+            self.KNN.save(directory)
+        settings = {'n_nearest': self.n_nearest,
+                    'glove_model': self.glove_model,
+                    'index': self.index,
+                    'n_lists': self.n_lists,
+                    'n_probe': self.n_probe,
+                    'tfidf': self.tfidf,
+                    'max_words': self.max_words,
+                    'n_documents': len(self.vectors)}
+        with open(settings_path, 'w') as FP:
+            json.dump(settings, FP)
+
+
+def has_index(directory):
+    '''
+    Whether a directory holds a (completely) saved index
+
+    Input: directory, path of the index directory
+    Output: bool
+    '''
+    return os.path.exists(os.path.join(directory, SETTINGS_FILE))
+
+
+def load_model(directory):
+    '''
+    Load a model saved with Model.save, without refitting. The document
+    vectors (and ivf index) are memory-mapped read-only.
+
+    Input: directory, path of the index directory
+    Output: the fitted Model
+    '''
+    with open(os.path.join(directory, SETTINGS_FILE), 'r') as FP:
+        settings = json.load(FP)
+    model = Model(settings['n_nearest'], settings['glove_model'],
+                  index=settings.get('index', 'exact'),
+                  n_lists=settings.get('n_lists'),
+                  n_probe=settings.get('n_probe', 8))
+    model.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r')
+    model.tfidf = settings['tfidf']
+    model.max_words = settings['max_words']
+    if model.index == 'ivf':
+        model.KNN.load(directory)
+    else:
+        model.KNN.fit(model.vectors)
+    return model
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import nltk
+from nltk.corpus import stopwords
+
+'''
+Tokenization of the documents
+
+Each document is split into tokens, which are tagged with their parts of
+speech, and the stopwords and adjectives are filtered out. The stopwords and
+the tags to filter are frozen sets, built once, so each token is checked in
+constant time.
+
+Tagging is the costly part, so the documents are tokenized across a process
+pool, a chunk of documents at a time. The tokens can also be kept in a cache
+directory, one file per document, keyed by a hash of the document's text. So
+refitting, or trying other TF-IDF settings, on documents already seen skips
+tokenizing them again.
+'''
+
+# parts of speech filtered out (adjectives)
+FILTERED_TAGS = frozenset(['JJ', 'JJR', 'JJS'])
+
+# bump when the tokenization changes, so old cached tokens are not used
+TOKENIZER_VERSION = '1'
+
+# stopwords as a frozen set, built when first needed
+STOPWORDS = None
+
+
+def tokenize_doc(document):
+    '''
+    Tokenize a single document, filtering out also stopwords
+
+    Input: document, the untokenized text
+    Output: set of tokens
+    '''
+    global STOPWORDS
+    if STOPWORDS is None:
+        STOPWORDS = frozenset(stopwords.words('english'))
+
+    tokens = nltk.tokenize.word_tokenize(document)
+    tags = nltk.pos_tag(tokens)
+    return {token for token, tag in tags
+            if token not in STOPWORDS and tag not in FILTERED_TAGS}
+
+
+def doc_key(document):
+    '''
+    Cache key of a document, a hash of its text (and the tokenizer version)
+
+    Input: document, the untokenized text
+    Output: hex digest of the hash
+    '''
+    return hashlib.sha256((TOKENIZER_VERSION + '\n' + document).encode('utf-8')).hexdigest()
+
+
+def load_tokens(cache_dir, key):
+    '''
+    Read the cached tokens of a document
+
+    Input: cache_dir, path of the cache directory
+           key, the document's key
+    Output: set of tokens, or None if not cached
+    '''
+    try:
+        with open(os.path.join(cache_dir, key[:2], key + '.json'), 'r') as FP:
+            return set(json.load(FP))
+    except (OSError, ValueError):
+        return None
+
+
+def save_tokens(cache_dir, key, tokens):
+    '''
+    Cache the tokens of a document, written to a temporary file first so a
+    partly written file is never read
+
+    Input: cache_dir, path of the cache directory
+           key, the document's key
+           tokens, set of tokens
+    '''
+    directory = os.path.join(cache_dir, key[:2])
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, key + '.json')
+    temp_path = file_path + f'.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as FP:
+        json.dump(sorted(tokens), FP)
+    os.replace(temp_path, file_path)
+
+
+def tokenize_docs(documents, n_jobs=None, chunk_size=16, cache_dir=None):
+    '''
+    Tokenize many documents, across a process pool, using the cache
+
+    Input: documents, list of untokenized documents
+           n_jobs, int, number of worker processes (default is all the cores,
+                   1 tokenizes in this process)
+           chunk_size, int, documents sent to a worker at a time. With no more
+                       documents to tokenize than this, no pool is started.
+           cache_dir, path of the token cache directory (optional)
+    Output: list of sets of tokens, one per document
+    '''
+    doc_tokens = [None] * len(documents)
+    if cache_dir is not None:
+        keys = [doc_key(document) for document in documents]
+        doc_tokens = [load_tokens(cache_dir, key) for key in keys]
+
+    todo = [index for index, tokens in enumerate(doc_tokens) if tokens is None]
+    todo_docs = [documents[index] for index in todo]
+    if n_jobs == 1 or len(todo) <= chunk_size:
+        results = [tokenize_doc(document) for document in todo_docs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(tokenize_doc, todo_docs, chunksize=chunk_size))
+
+    for index, tokens in zip(todo, results):
+        doc_tokens[index] = tokens
+        if cache_dir is not None:
+            save_tokens(cache_dir, keys[index], tokens)
+    return doc_tokens